@@ -0,0 +1,270 @@
+"""Latency and throughput benchmark for Whisper Typer.
+
+Replays recorded WAV/FLAC fixtures through AudioRecorder as if they came
+from a microphone. A fake InputStream delivers blocks on a real-time
+clock, and text is typed into a stub backend. For every combination of
+model size, compute type, beam size, decoding profile and VAD engine, the benchmark reports
+end-to-end latency percentiles, real-time factor, CPU use and memory.
+
+    python benchmark.py fixtures/ --model-size tiny base --beam-size 1 5 --output bench.json
+"""
+import argparse
+import copy
+import itertools
+import json
+import logging
+import os
+import platform
+import queue
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+import whisper_typer as wt
+
+
+class CallbackStop(Exception):
+    pass
+
+class FakeInputStream:
+    """Stands in for sd.InputStream, feeding fixture audio to the callback on a simulated clock"""
+    audio = np.zeros(0, dtype=np.float32)
+    speed = 1.0
+    done = threading.Event()  # Set once the whole fixture has been delivered
+
+    def __init__(self, samplerate, channels, dtype, blocksize, callback, **kwargs):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.callback = callback
+        self.status = types.SimpleNamespace(input_overflow=False)
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finished.set()
+        self.thread.join()
+
+    def run(self):
+        start = time.perf_counter()
+        block_duration = self.blocksize / self.samplerate / self.speed
+        for i, offset in enumerate(range(0, len(self.audio), self.blocksize)):
+            if self.finished.is_set():
+                return
+            delay = start + i * block_duration - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            block = self.audio[offset:offset + self.blocksize]
+            if len(block) < self.blocksize:
+                block = np.pad(block, (0, self.blocksize - len(block)))
+            try:
+                self.callback(block[:, None], self.blocksize, None, self.status)
+            except CallbackStop:
+                return
+        FakeInputStream.done.set()
+
+class TypingQueue:
+    """Stands in for the GUI's text queue, handing each transcript to the output worker as it arrives"""
+    def __init__(self, output_worker):
+        self.output_worker = output_worker
+        self.transcripts = []
+
+    def put(self, transcript):
+        self.transcripts.append(transcript)
+        self.output_worker.submit(transcript)
+
+def load_fixture(path, tail_seconds):
+    """Read a fixture as 16 kHz mono, followed by enough silence to close its last utterance"""
+    blocks = list(wt.iter_audio_blocks(path))
+    blocks.append(np.zeros(int(tail_seconds * wt.SAMPLE_RATE), dtype=np.float32))
+    return np.concatenate(blocks)
+
+def resident_memory_mb():
+    """Current RSS via psutil if installed, otherwise the peak RSS from getrusage"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+def replay(audio, settings):
+    """Run one fixture through a recorder and a stub typing sink; returns the typed texts and their latencies"""
+    FakeInputStream.audio = audio
+    FakeInputStream.done.clear()
+    status_queue = queue.Queue()
+    backend = wt.StubBackend(settings)
+    output_worker = wt.OutputWorker(status_queue, settings, backend)
+    output_worker.start()
+    text_queue = TypingQueue(output_worker)
+
+    recorder = wt.AudioRecorder(text_queue, status_queue, wt.LatestValue(), settings)
+    recorder.start()
+    while not FakeInputStream.done.wait(timeout=0.1):
+        if not recorder.is_alive():
+            break
+    recorder.stop()
+    recorder.join()
+    # The workers exit once everything queued before the stop has been decoded
+    if recorder.scheduler:
+        for worker in recorder.scheduler.workers:
+            worker.join()
+    elif recorder.inference_worker:
+        recorder.inference_worker.join()
+
+    output_worker.stop()
+    output_worker.join()
+    # The worker types transcripts in the order they were queued, one stub call each
+    latencies = [typed_at - speech_end
+                 for transcript, (typed_at, _) in zip(text_queue.transcripts, backend.typed)
+                 for speech_end in transcript.speech_ends]
+    return [text for _, text in backend.typed], latencies
+
+def run_config(fixtures, settings):
+    key = wt.ModelRegistry.key_from_settings(settings)
+    load_start = time.perf_counter()
+    wt.MODEL_REGISTRY.get(key)
+    load_seconds = time.perf_counter() - load_start
+
+    wt.METRICS.reset()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    typed = {}
+    latencies = []
+    for path, audio in fixtures.items():
+        typed[path], fixture_latencies = replay(audio, settings)
+        latencies.extend(fixture_latencies)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    snapshot = wt.METRICS.snapshot()
+    latency = snapshot["latency_seconds"]
+    decode = latency.get("decode", {})
+    decoded_seconds = snapshot["counters"].get("audio_seconds_decoded", 0.0)
+    return {
+        "model_load_seconds": load_seconds,
+        # Exact percentiles of the raw samples; the histogram buckets are too coarse to catch regressions
+        "utterances": len(latencies),
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p95": float(np.percentile(latencies, 95)) if latencies else None,
+        "rtf": decode.get("count", 0) * decode.get("mean", 0.0) / decoded_seconds if decoded_seconds else None,
+        "cpu_percent": 100 * cpu / wall if wall else None,
+        "rss_mb": resident_memory_mb(),
+        "dropped_samples": snapshot["counters"].get("dropped_samples", 0),
+        "decode_fallbacks": snapshot["counters"].get("decode_fallbacks", 0),
+        "metrics": snapshot,
+        "typed": typed
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end latency and throughput on recorded audio")
+    parser.add_argument("fixtures", nargs="+", help="WAV/FLAC files or directories to replay")
+    parser.add_argument("--model-size", nargs="+", default=["base"])
+    parser.add_argument("--compute-type", nargs="+", default=["int8"])
+    parser.add_argument("--beam-size", nargs="+", type=int, default=[5])
+    parser.add_argument("--decoding-profile", nargs="+", default=["auto"],
+                        choices=["auto"] + list(wt.DECODING_PROFILES))
+    parser.add_argument("--vad-engine", nargs="+", default=["energy"], choices=list(wt.VAD_ENGINES))
+    parser.add_argument("--cpu-threads", nargs="+", type=int, default=[0],
+                        help="Threads per model worker; 0 sizes them to the host")
+    parser.add_argument("--model-workers", nargs="+", type=int, default=[0],
+                        help="Model workers; 0 sizes them to the host")
+    parser.add_argument("--reserved-cores", nargs="+", type=int, default=[1])
+    parser.add_argument("--pin-inference", nargs="+", default=["off"], choices=["off", "on"])
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed; above 1 feeds audio faster than real time, which skews latency")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s [%(threadName)s] %(message)s")
+    # Swap the microphone for the fixture player once the real module can no longer replace it
+    wt.load_heavy_modules(("sounddevice", "faster_whisper"))
+    wt.sd = types.SimpleNamespace(InputStream=FakeInputStream, CallbackStop=CallbackStop,
+                                  query_devices=lambda device=None, kind=None: {
+                                      "name": "benchmark fixture", "default_samplerate": wt.SAMPLE_RATE,
+                                      "max_input_channels": 1})
+    FakeInputStream.speed = args.speed
+
+    # Defaults rather than the user's saved settings, so results don't depend on who runs the benchmark
+    base_settings = wt.apply_defaults({})
+    # The fixture stands in for the default device
+    base_settings["input_device"] = ""
+    base_settings["language"] = args.language
+    paths = wt.find_audio_files(args.fixtures)
+    if not paths:
+        print("No WAV or FLAC fixtures found", file=sys.stderr)
+        return 1
+    tail = wt.AudioBuffer(base_settings).silence_duration + 0.5
+    fixtures = {path: load_fixture(path, tail) for path in paths}
+
+    results = []
+    grid = itertools.product(args.model_size, args.compute_type, args.beam_size, args.decoding_profile,
+                             args.vad_engine, args.cpu_threads, args.model_workers, args.reserved_cores,
+                             args.pin_inference)
+    for (model_size, compute_type, beam_size, decoding_profile, vad_engine, cpu_threads, model_workers,
+         reserved_cores, pin_inference) in grid:
+        config = {
+            "model_size": model_size,
+            "compute_type": compute_type,
+            "beam_size": beam_size,
+            "decoding_profile": decoding_profile,
+            "vad_engine": vad_engine,
+            "cpu_threads": cpu_threads,
+            "model_workers": model_workers,
+            "reserved_cores": reserved_cores,
+            "pin_inference": pin_inference == "on"
+        }
+        # A fresh copy per run, so one run's noise floor or detected language can't seed the next
+        settings = dict(copy.deepcopy(base_settings), **config)
+        plan = wt.ResourcePlan(settings)
+        result = run_config(fixtures, settings)
+        results.append(dict(config, resources=plan.describe(), **result))
+        print(f"{model_size:>9} {compute_type:>8} beam={beam_size} {decoding_profile:<8} vad={vad_engine:<13} "
+              f"threads={plan.cpu_threads}x{plan.num_workers} reserved={reserved_cores} pin={pin_inference:<3} "
+              f"p50={result['latency_p50'] or 0:.3f}s p95={result['latency_p95'] or 0:.3f}s "
+              f"rtf={result['rtf'] or 0:.3f} cpu={result['cpu_percent'] or 0:.0f}% "
+              f"rss={result['rss_mb'] or 0:.0f}MB")
+
+    # Lowest p95 latency wins; configurations that typed nothing are skipped
+    measured = [result for result in results if result["latency_p95"] is not None]
+    best = min(measured, key=lambda result: result["latency_p95"], default=None)
+    if best is not None:
+        print("Best configuration: " + ", ".join(
+            f"{key}={best[key]}" for key in ("model_size", "compute_type", "beam_size", "decoding_profile",
+                                             "vad_engine", "cpu_threads", "model_workers", "reserved_cores",
+                                             "pin_inference")
+        ) + f" (p95 {best['latency_p95']:.3f}s, resources {best['resources']})")
+
+    report = {
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count()
+        },
+        "fixtures": paths,
+        "speed": args.speed,
+        "settings": base_settings,
+        "results": results,
+        "best": {key: value for key, value in best.items() if key not in ("metrics", "typed")} if best else None
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
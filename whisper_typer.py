@@ -1,220 +1,2503 @@
+import time
+STARTUP_TIME = time.perf_counter()
 import os
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+import sys
+import importlib
 import json
+import copy
+import logging
+import bisect
+import argparse
+import struct
+import hashlib
+import sqlite3
+import zlib
+import tempfile
 import threading
 import queue
-import sounddevice as sd
+import asyncio
+import socket
+import types
+import tkinter
 import numpy as np
 import customtkinter as ctk
-from faster_whisper import WhisperModel
 from typing import Optional
-import pyautogui
-from pynput import keyboard as kb
-from pynput.keyboard import Key
 import warnings
-from collections import deque
-import time
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
-pyautogui.FAILSAFE = True
-pyautogui.PAUSE = 0.001
+log = logging.getLogger("whisper_typer")
+
+# Heavy modules are imported by load_heavy_modules() so the window can show before they are ready
+sd = None
+WhisperModel = None
+kb = None
+Key = None
+pyperclip = None
+
+HEAVY_MODULES = ("sounddevice", "faster_whisper", "pynput.keyboard", "pyperclip")
+IMPORT_TIMELINE = []  # (module, seconds since startup when done, seconds spent importing)
+_loaded_modules = set()
+_import_lock = threading.Lock()
+
+def load_heavy_modules(names=HEAVY_MODULES):
+    """Import the given heavy modules once, recording how long each one took"""
+    global sd, WhisperModel, kb, Key, pyperclip
+    with _import_lock:
+        for name in names:
+            if name in _loaded_modules:
+                continue
+            started = time.perf_counter()
+            module = importlib.import_module(name)
+            finished = time.perf_counter()
+            IMPORT_TIMELINE.append((name, finished - STARTUP_TIME, finished - started))
+            log.info(f"Imported {name} in {finished - started:.3f}s")
+            if name == "sounddevice":
+                sd = module
+            elif name == "faster_whisper":
+                WhisperModel = module.WhisperModel
+            elif name == "pynput.keyboard":
+                kb = module
+                Key = module.Key
+            elif name == "pyperclip":
+                pyperclip = module
+            _loaded_modules.add(name)
+
+class LatencyHistogram:
+    """Latency histogram with fixed log-spaced buckets from 1 ms to about a minute"""
+    BOUNDS = tuple(0.001 * 2 ** (i / 2) for i in range(32))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float):
+        """Upper bound of the bucket holding the q-th percentile"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+            # Upper bucket bound in seconds -> count, empty buckets omitted
+            "buckets": {
+                (f"{bound:.4f}" if i < len(self.BOUNDS) else "inf"): count
+                for i, (bound, count) in enumerate(zip(self.BOUNDS + (float("inf"),), self.counts)) if count
+            }
+        }
+
+class Metrics:
+    """Thread-safe counters, gauges and per-stage latency histograms"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def increment(self, name: str, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block into the histogram for one pipeline stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "latency_seconds": {name: h.snapshot() for name, h in self.histograms.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges)
+            }
+
+    def export(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=4)
+
+# Stages: capture, vad, queue_wait, decode, typing, end_to_end
+METRICS = Metrics()
+
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large-v3"]
+# Upper bound on the concurrent transcribe() calls a loaded model accepts
+MODEL_NUM_WORKERS = 4
+
+# Cores this process may run on, read before any thread is pinned
+HOST_CORES = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+
+# Nice values on Linux, thread priorities on Windows
+THREAD_PRIORITIES = {
+    "normal": (0, 0),
+    "below_normal": (5, -1),
+    "idle": (19, -15)
+}
+
+def apply_thread_policy(cores=None, priority: str = "normal"):
+    """Pin the calling thread to cores and set its priority; threads it starts later inherit both on Linux"""
+    try:
+        if cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        nice, windows_priority = THREAD_PRIORITIES.get(priority, (0, 0))
+        if sys.platform == "win32" and windows_priority:
+            import ctypes
+            ctypes.windll.kernel32.SetThreadPriority(ctypes.windll.kernel32.GetCurrentThread(), windows_priority)
+        elif sys.platform.startswith("linux") and nice:
+            # Linux applies nice values per thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+    except OSError as e:
+        log.warning(f"Could not apply inference thread policy: {str(e)}")
+
+def native_thread_ids():
+    """Ids of every thread in this process, including ones started by native libraries (Windows only)"""
+    import ctypes
+    from ctypes import wintypes
+
+    class THREADENTRY32(ctypes.Structure):
+        _fields_ = [("dwSize", wintypes.DWORD), ("cntUsage", wintypes.DWORD), ("th32ThreadID", wintypes.DWORD),
+                    ("th32OwnerProcessID", wintypes.DWORD), ("tpBasePri", wintypes.LONG),
+                    ("tpDeltaPri", wintypes.LONG), ("dwFlags", wintypes.DWORD)]
+
+    kernel32 = ctypes.windll.kernel32
+    kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+    snapshot = kernel32.CreateToolhelp32Snapshot(0x4, 0)  # TH32CS_SNAPTHREAD
+    if snapshot in (None, ctypes.c_void_p(-1).value):
+        raise ctypes.WinError()
+    entry = THREADENTRY32()
+    entry.dwSize = ctypes.sizeof(entry)
+    pid = os.getpid()
+    ids = set()
+    try:
+        found = kernel32.Thread32First(snapshot, ctypes.byref(entry))
+        while found:
+            if entry.th32OwnerProcessID == pid:
+                ids.add(entry.th32ThreadID)
+            found = kernel32.Thread32Next(snapshot, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snapshot)
+    return ids
+
+@contextmanager
+def native_thread_priority(priority: str):
+    """Give threads that native code starts inside the block the inference priority.
+
+    Windows threads don't inherit their creator's priority, so CTranslate2's
+    decode threads are found by diffing the process's threads around the
+    block. On Linux they inherit the nice value and this does nothing.
+    """
+    windows_priority = THREAD_PRIORITIES.get(priority, (0, 0))[1]
+    if sys.platform != "win32" or not windows_priority:
+        yield
+        return
+    try:
+        before = native_thread_ids()
+    except OSError as e:
+        log.warning(f"Could not list process threads: {str(e)}")
+        before = None
+    yield
+    if before is None:
+        return
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.windll.kernel32
+    kernel32.OpenThread.restype = wintypes.HANDLE
+    # Python threads started meanwhile, e.g. by the GUI, keep their own priority
+    python_threads = {thread.native_id for thread in threading.enumerate()}
+    try:
+        started = native_thread_ids() - before - python_threads
+    except OSError as e:
+        log.warning(f"Could not list process threads: {str(e)}")
+        return
+    for thread_id in started:
+        handle = kernel32.OpenThread(0x0020, False, thread_id)  # THREAD_SET_INFORMATION
+        if handle:
+            kernel32.SetThreadPriority(handle, windows_priority)
+            kernel32.CloseHandle(handle)
+    log.debug(f"Set {priority} priority on {len(started)} inference threads")
+
+class ResourcePlan:
+    """How inference shares the CPU with capture and the GUI, sized to this host.
+
+    reserved_cores are left out of the thread budget (and, when pinning, out
+    of the inference core set) so the audio callback and the window stay
+    responsive while decoding saturates the rest. model_workers and
+    cpu_threads override the computed sizes.
+    """
+    def __init__(self, settings: dict):
+        reserved = max(0, min(settings.get("reserved_cores", 1), len(HOST_CORES) - 1))
+        available = len(HOST_CORES) - reserved
+        # CTranslate2 runs cpu_threads per worker, so their product is what decoding can occupy
+        self.num_workers = settings.get("model_workers") or max(1, min(MODEL_NUM_WORKERS, available // 2))
+        self.cpu_threads = settings.get("cpu_threads") or max(1, available // self.num_workers)
+        configured = set(settings.get("inference_cores") or []) & set(HOST_CORES)
+        if configured:
+            self.cores = tuple(sorted(configured))
+        elif settings.get("pin_inference", False) and reserved:
+            # Capture and the GUI keep the first cores to themselves
+            self.cores = tuple(HOST_CORES[reserved:])
+        else:
+            self.cores = None
+        self.priority = settings.get("inference_priority", "below_normal")
+
+    def apply(self):
+        apply_thread_policy(self.cores, self.priority)
+
+    def describe(self):
+        return {"cpu_threads": self.cpu_threads, "num_workers": self.num_workers,
+                "cores": list(self.cores) if self.cores else None, "priority": self.priority}
+
+def user_data_dir():
+    """Per-user directory for downloaded models and other app data"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+        return os.path.join(base, "WhisperTyper")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Application Support/WhisperTyper")
+    base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, "whisper_typer")
+
+def user_config_dir():
+    """Per-user directory for the settings file"""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Roaming")
+        return os.path.join(base, "WhisperTyper")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Application Support/WhisperTyper")
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "whisper_typer")
+
+def atomic_write_json(path, data):
+    """Write JSON to a temp file in the same directory and rename it over path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+MANIFEST_NAME = "manifest.json"
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _model_files(model_dir):
+    for root, _, names in os.walk(model_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, model_dir)
+            if relative != MANIFEST_NAME and not relative.startswith("."):
+                yield relative, path
+
+def verify_model_dir(model_dir, full_hash=False):
+    """Check a pinned model against its manifest: sizes always, SHA-256 when full_hash is set"""
+    try:
+        with open(os.path.join(model_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    for relative, entry in manifest.get("files", {}).items():
+        path = os.path.join(model_dir, relative)
+        if not os.path.isfile(path) or os.path.getsize(path) != entry["size"]:
+            return False
+        if full_hash and _sha256(path) != entry["sha256"]:
+            return False
+    return bool(manifest.get("files"))
+
+def ensure_local_model(model_size: str, full_hash=False):
+    """Return a local directory holding model_size, downloading and pinning it on first use.
+
+    Once a model has a manifest, loading it never touches the network.
+    """
+    if os.path.isdir(model_size):
+        return model_size
+    model_dir = os.path.join(user_data_dir(), "models", model_size)
+    if verify_model_dir(model_dir, full_hash):
+        return model_dir
+
+    log.info(f"Downloading Whisper model {model_size} to {model_dir}")
+    from faster_whisper.utils import download_model
+    download_model(model_size, output_dir=model_dir)
+    files = {
+        relative: {"size": os.path.getsize(path), "sha256": _sha256(path)}
+        for relative, path in _model_files(model_dir)
+    }
+    # The manifest is written last, so an interrupted download is never treated as pinned
+    atomic_write_json(os.path.join(model_dir, MANIFEST_NAME), {
+        "model": model_size,
+        "created": time.time(),
+        "files": files
+    })
+    return model_dir
+
+def warm_up_model(model):
+    """Run one short decode so kernel and allocator setup doesn't land on the first real utterance"""
+    started = time.perf_counter()
+    noise = np.random.default_rng(0).normal(0, 0.01, SAMPLE_RATE).astype(np.float32)
+    segments, _ = model.transcribe(noise, language="en", beam_size=1, without_timestamps=True, vad_filter=False)
+    list(segments)
+    elapsed = time.perf_counter() - started
+    METRICS.set_gauge("model_warmup_seconds", elapsed)
+    log.info(f"Model warm-up took {elapsed:.3f}s")
+
+class ModelRegistry:
+    """Process-wide cache of loaded Whisper models, keyed by model config and evicted LRU"""
+    def __init__(self, max_models=1, warmup=True, verify_hash=False):
+        self.max_models = max_models
+        self.warmup = warmup
+        self.verify_hash = verify_hash
+        self.models = OrderedDict()  # key -> Future resolving to a WhisperModel
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key_from_settings(settings: dict):
+        # Thread placement is part of the key: CTranslate2 fixes its threads when the model is created
+        plan = ResourcePlan(settings)
+        return (
+            settings.get("model_size", "base"),
+            settings.get("device", "cpu"),
+            settings.get("compute_type", "int8"),
+            plan.cpu_threads,
+            plan.num_workers,
+            plan.cores,
+            plan.priority
+        )
+
+    def preload(self, key) -> Future:
+        """Start loading the model for key in the background if it isn't cached yet"""
+        with self.lock:
+            future = self.models.get(key)
+            if future is not None:
+                self.models.move_to_end(key)
+                return future
+            future = Future()
+            self.models[key] = future
+            while len(self.models) > self.max_models:
+                evicted_key, _ = self.models.popitem(last=False)
+                log.info(f"Evicting Whisper model {evicted_key}")
+        threading.Thread(target=self._load, args=(key, future), daemon=True).start()
+        return future
+
+    def get(self, key):
+        """Return the model for key, blocking until it has finished loading"""
+        return self.preload(key).result()
+
+    def is_ready(self, key):
+        with self.lock:
+            future = self.models.get(key)
+        return future is not None and future.done() and future.exception() is None
+
+    def _load(self, key, future: Future):
+        model_size, device, compute_type, cpu_threads, num_workers, cores, priority = key
+        log.info(f"Loading Whisper model {key}")
+        # The model's worker threads are started from this thread and inherit its placement (priority only on Linux)
+        apply_thread_policy(cores, priority)
+        try:
+            load_heavy_modules(("faster_whisper",))
+            try:
+                model_path = ensure_local_model(model_size, self.verify_hash)
+            except Exception as e:
+                # Offline and not pinned yet: let faster-whisper try its own cache
+                log.warning(f"Could not pin model {model_size} locally: {str(e)}")
+                model_path = model_size
+            # Warm-up runs inside the block too, since some decode threads only start on first use
+            with native_thread_priority(priority):
+                model = WhisperModel(
+                    model_size_or_path=model_path,
+                    device=device,
+                    compute_type=compute_type,
+                    cpu_threads=cpu_threads,
+                    num_workers=num_workers
+                )
+                if self.warmup:
+                    warm_up_model(model)
+        except Exception as e:
+            # Drop the failed entry so the next request retries the load
+            with self.lock:
+                if self.models.get(key) is future:
+                    del self.models[key]
+            future.set_exception(e)
+            return
+        future.set_result(model)
+
+MODEL_REGISTRY = ModelRegistry()
+
+SAMPLE_RATE = 16000
+VAD_FRAME_SIZE = 512  # 32 ms at 16 kHz, the frame size Silero expects
+
+def frame_rms(frames):
+    return np.sqrt(np.mean(np.square(frames), axis=-1))
+
+class EnergyVad:
+    """Marks frames as speech when their RMS exceeds the sensitivity threshold"""
+    def __init__(self, settings: dict):
+        pass
+
+    def reset(self):
+        pass
+
+    def is_speech(self, frames, threshold):
+        return frame_rms(frames) > threshold
+
+class SpectralFluxVad:
+    """Energy gate combined with smoothed spectral flux, which rejects steady noise like fans and hum"""
+    num_bands = 16
+
+    def __init__(self, settings: dict):
+        self.flux_threshold = settings.get("vad_flux_threshold", 0.25)
+        self.window = np.hanning(VAD_FRAME_SIZE).astype(np.float32)
+        self.reset()
+
+    def reset(self):
+        self.previous_bands = None
+        self.smoothed_flux = 0.0
+
+    def is_speech(self, frames, threshold):
+        spectra = np.abs(np.fft.rfft(frames * self.window, axis=1))[:, 1:] ** 2
+        # Averaging bins into bands keeps the flux of random noise low
+        bands = np.log1p(spectra.reshape(len(frames), self.num_bands, -1).sum(axis=2) * 1e4)
+        previous = bands[:1] if self.previous_bands is None else self.previous_bands[None, :]
+        deltas = np.diff(np.vstack([previous, bands]), axis=0)
+        flux = np.maximum(deltas, 0).mean(axis=1)
+        self.previous_bands = bands[-1]
+
+        smoothed = np.empty_like(flux)
+        for i, value in enumerate(flux):
+            self.smoothed_flux = 0.7 * self.smoothed_flux + 0.3 * value
+            smoothed[i] = self.smoothed_flux
+
+        rms = frame_rms(frames)
+        return (rms > threshold) & ((smoothed > self.flux_threshold) | (rms > 4 * threshold))
+
+def find_silero_model(settings: dict):
+    """Paths of the Silero VAD model: vad_model_path, or whatever the installed faster-whisper bundles"""
+    if settings.get("vad_model_path"):
+        return [settings["vad_model_path"]]
+    from faster_whisper.utils import get_assets_path
+
+    assets = get_assets_path()
+    names = sorted(os.listdir(assets)) if os.path.isdir(assets) else []
+    models = {prefix: [os.path.join(assets, name) for name in names
+                       if name.startswith(prefix) and name.endswith(".onnx")]
+              for prefix in ("silero_vad", "silero_encoder", "silero_decoder")}
+    # Releases up to 1.0 ship a single model; later ones split it into an encoder and a decoder
+    if models["silero_vad"]:
+        return [models["silero_vad"][-1]]
+    if models["silero_encoder"] and models["silero_decoder"]:
+        return [models["silero_encoder"][-1], models["silero_decoder"][-1]]
+    raise FileNotFoundError(f"no Silero model in {assets}, set vad_model_path to a silero_vad.onnx file")
+
+class SileroVad:
+    """Framewise Silero VAD model run through onnxruntime.
+
+    Inputs are read from the model rather than assumed, since faster-whisper
+    has shipped v4 (h and c), v5 (one state tensor, split or not) and v6
+    models, with or without the sample rate input and the 64-sample context.
+    """
+    def __init__(self, settings: dict):
+        import onnxruntime
+
+        paths = find_silero_model(settings)
+        options = onnxruntime.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = 1
+        sessions = [onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"], sess_options=options)
+                    for path in paths]
+        # A split model runs a stateless encoder over every frame and a recurrent decoder over its features
+        self.encoder = sessions[0] if len(sessions) == 2 else None
+        self.session = sessions[-1]
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        self.state_inputs = [i for name, i in inputs.items() if name not in ("input", "sr")]
+        self.needs_sample_rate = "sr" in inputs
+        audio_input = {i.name: i for i in (self.encoder or self.session).get_inputs()}["input"]
+        # v5+ models take each frame prefixed with the last 64 samples of the one before it
+        self.context_size = 64 if audio_input.shape[-1] == VAD_FRAME_SIZE + 64 or "state" in inputs else 0
+        self.probability_threshold = settings.get("vad_probability_threshold", 0.5)
+        self.sample_rate = np.array(SAMPLE_RATE, dtype=np.int64)
+        self.reset()
+        # One silent frame now, so a model this can't drive falls back to another VAD instead of failing mid-capture
+        self.is_speech(np.zeros((1, VAD_FRAME_SIZE), dtype=np.float32), 0)
+        self.reset()
+
+    def reset(self):
+        # Symbolic dimensions are the batch, which is always one stream here
+        self.states = {i.name: np.zeros([d if isinstance(d, int) else 1 for d in i.shape], dtype=np.float32)
+                       for i in self.state_inputs}
+        self.context = np.zeros(self.context_size, dtype=np.float32)
+
+    def run_decoder(self, model_input):
+        """Advance the recurrent state by one frame; returns its speech probability"""
+        feed = dict(self.states, input=model_input)
+        if self.needs_sample_rate:
+            feed["sr"] = self.sample_rate
+        outputs = self.session.run(None, feed)
+        # The updated states follow the probability, in the order the state inputs are declared
+        self.states = {state_input.name: state for state_input, state in zip(self.state_inputs, outputs[1:])}
+        return outputs[0].reshape(-1)[0]
+
+    def is_speech(self, frames, threshold):
+        contexts = np.concatenate([self.context[None, :], frames[:-1, frames.shape[1] - self.context_size:]])
+        self.context = frames[-1, frames.shape[1] - self.context_size:].copy()
+        frames = np.concatenate([contexts, frames], axis=1)
+        if self.encoder:
+            frames = self.encoder.run(None, {"input": frames})[0].reshape(len(frames), -1)
+        # The model is recurrent, so frames of one stream have to be run in order
+        probabilities = np.array([self.run_decoder(frame[None, :]) for frame in frames], dtype=np.float32)
+        return probabilities > self.probability_threshold
+
+VAD_ENGINES = {
+    "energy": EnergyVad,
+    "spectral_flux": SpectralFluxVad,
+    "silero": SileroVad
+}
+
+def create_vad(settings: dict):
+    """Build the VAD engine named in settings, falling back to the energy detector"""
+    name = settings.get("vad_engine", "energy")
+    try:
+        return VAD_ENGINES[name](settings)
+    except Exception as e:
+        log.error(f"Could not create {name} VAD, using energy detector: {str(e)}")
+        vad = EnergyVad(settings)
+        # Lets the caller tell the user the engine they picked isn't running
+        vad.fallback_reason = f"{name} VAD unavailable ({str(e)}), using energy detector"
+        return vad
+
+class NoiseFloorTracker:
+    """Streaming noise floor by minimum statistics over a rolling window.
+
+    The window is split into sub-windows whose minimum frame RMS is kept, so
+    the floor drops as soon as the room gets quieter and rises again within
+    noise_window_s once it gets louder. Speech rarely holds its level for a
+    whole sub-window, so it barely moves the estimate.
+    """
+    subwindows = 8
+    # The minimum of noisy frame levels underestimates the mean noise level
+    bias = 1.2
+
+    def __init__(self, settings: dict, initial: Optional[float] = None):
+        window = settings.get("noise_window_s", 5.0)
+        self.subwindow_frames = max(1, round(window / self.subwindows * SAMPLE_RATE / VAD_FRAME_SIZE))
+        self.snr = settings.get("noise_snr", 3.0)
+        self.min_threshold = settings.get("noise_min_threshold", 0.002)
+        # A floor remembered for the device stands in until the first sub-window completes
+        self.minima = deque([initial / self.bias] if initial else [], maxlen=self.subwindows)
+        self.current_min = np.inf
+        self.current_count = 0
+        self.floor = initial or 0.0
+
+    def update(self, rms):
+        """Feed the RMS of consecutive frames and return the updated floor"""
+        pos = 0
+        while pos < len(rms):
+            take = min(self.subwindow_frames - self.current_count, len(rms) - pos)
+            self.current_min = min(self.current_min, float(rms[pos:pos + take].min()))
+            self.current_count += take
+            pos += take
+            if self.current_count == self.subwindow_frames:
+                self.minima.append(self.current_min)
+                self.current_min = np.inf
+                self.current_count = 0
+        floor = min(min(self.minima, default=np.inf), self.current_min)
+        if np.isfinite(floor):
+            self.floor = floor * self.bias
+        return self.floor
+
+    def threshold(self):
+        """Speech threshold: a fixed margin above the floor, never below min_threshold"""
+        return max(self.floor * self.snr, self.min_threshold)
+
+class AutoGain:
+    """Normalizes speech loudness ahead of the decoder so quiet and loud speakers look alike to Whisper"""
+    def __init__(self, settings: dict):
+        self.target = settings.get("agc_target_rms", 0.05)
+        self.max_gain = settings.get("agc_max_gain", 10.0)
+        self.smoothing = 0.3  # Per-chunk step towards the target gain when streaming
+        self.gain = 1.0
+
+    def target_gain(self, audio, noise_floor: float = 0.0):
+        """Gain that brings the frames above the noise floor to the target level, or None if there are none"""
+        count = len(audio) // VAD_FRAME_SIZE
+        if not count:
+            return None
+        rms = frame_rms(audio[:count * VAD_FRAME_SIZE].reshape(count, VAD_FRAME_SIZE))
+        active = rms[rms > max(2 * noise_floor, 1e-4)]
+        if not len(active):
+            return None
+        level = float(np.sqrt(np.mean(np.square(active))))
+        peak = float(np.max(np.abs(audio)))
+        # Never clip, and never boost the noise by more than max_gain
+        return min(self.target / level, self.max_gain, 0.99 / peak)
+
+    def normalize(self, audio, noise_floor: float = 0.0):
+        """Scale a whole utterance in place and return it"""
+        gain = self.target_gain(audio, noise_floor) or 1.0
+        METRICS.set_gauge("agc_gain", gain)
+        audio *= gain
+        return audio
+
+    def stream(self, chunk, noise_floor: float = 0.0):
+        """Scale a streaming chunk in place, moving the gain smoothly between chunks"""
+        gain = self.target_gain(chunk, noise_floor)
+        if gain is not None:
+            self.gain += self.smoothing * (gain - self.gain)
+        METRICS.set_gauge("agc_gain", self.gain)
+        chunk *= self.gain
+        np.clip(chunk, -1.0, 1.0, out=chunk)
+        return chunk
+
+class PolyphaseResampler:
+    """Streaming rational resampler: a Kaiser-windowed sinc split into polyphase branches.
+
+    Only the output samples are computed, each as one dot product of the
+    input history with the branch for its phase, vectorized over a block.
+    The last taps_per_phase - 1 input samples carry over between blocks.
+    """
+    zero_crossings = 16
+
+    def __init__(self, in_rate: int, out_rate: int = SAMPLE_RATE):
+        divisor = np.gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // divisor
+        self.down = int(in_rate) // divisor
+        self.passthrough = self.up == self.down
+        if self.passthrough:
+            return
+        ratio = max(self.up, self.down)
+        length = 2 * self.zero_crossings * ratio + 1
+        t = np.arange(length) - (length - 1) / 2
+        taps = np.sinc(t / ratio) * np.kaiser(length, 8.6)
+        self.taps_per_phase = -(-length // self.up)
+        taps = np.pad(taps, (0, self.taps_per_phase * self.up - length))
+        # branches[p, k] = taps[p + k * up], each branch normalized to unity DC gain
+        self.branches = taps.reshape(self.taps_per_phase, self.up).T.astype(np.float32)
+        self.branches /= self.branches.sum(axis=1, keepdims=True)
+        self.offsets = np.arange(self.taps_per_phase)
+        self.history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self.consumed = 0  # Input samples received before the current block
+        self.produced = 0  # Output samples emitted so far
+
+    def process(self, block):
+        """Resample the next block of mono samples; returns the output samples they complete"""
+        if self.passthrough:
+            return block
+        buffer = np.concatenate([self.history, block])
+        buffer_start = self.consumed - len(self.history)
+        last = self.consumed + len(block) - 1
+        end = ((last + 1) * self.up - 1) // self.down + 1
+        positions = np.arange(self.produced, end, dtype=np.int64) * self.down
+        index = (positions // self.up - buffer_start)[:, None] - self.offsets[None, :]
+        output = np.einsum("ij,ij->i", buffer[index], self.branches[positions % self.up])
+        self.produced = end
+        self.consumed += len(block)
+        self.history = buffer[len(buffer) - len(self.history):]
+        return output.astype(np.float32, copy=False)
+
+def list_input_devices():
+    """Names of the audio devices that can record, in PortAudio order"""
+    load_heavy_modules(("sounddevice",))
+    return [device["name"] for device in sd.query_devices() if device["max_input_channels"] > 0]
+
+def capture_config(settings: dict):
+    """(device, sample rate, channels, block size) to open the input stream with natively"""
+    load_heavy_modules(("sounddevice",))
+    device = None
+    name = settings.get("input_device")
+    if name:
+        matches = [i for i, d in enumerate(sd.query_devices()) if d["name"] == name and d["max_input_channels"] > 0]
+        if matches:
+            device = matches[0]
+        else:
+            log.warning(f"Input device {name!r} not found, using the default device")
+    info = sd.query_devices(device, kind="input")
+    sample_rate = int(info["default_samplerate"])
+    # Stereo covers real microphones; multichannel interfaces often expose unused inputs
+    channels = max(1, min(int(info["max_input_channels"]), 2))
+    block_size = max(64, int(sample_rate * settings.get("capture_block_ms", 64) / 1000))
+    return device, sample_rate, channels, block_size
+
+class AudioRingBuffer:
+    """Preallocated float32 ring addressed by absolute sample position.
+
+    Every sample is stored twice, capacity apart, so any window of up to
+    capacity samples is available as a contiguous zero-copy view.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=np.float32)
+        self.write_pos = 0  # Total samples written so far
+
+    def write(self, samples):
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+            self.write_pos += count - self.capacity
+            count = self.capacity
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+        rest = count - first
+        self.data[start:start + first] = samples[:first]
+        self.data[start + self.capacity:start + self.capacity + first] = samples[:first]
+        if rest:
+            self.data[:rest] = samples[first:]
+            self.data[self.capacity:self.capacity + rest] = samples[first:]
+        # Publish the new samples only after they are in place
+        self.write_pos += count
+
+    def view(self, start: int, end: int):
+        """Zero-copy view of absolute samples [start, end)"""
+        start = max(start, end - self.capacity)
+        offset = start % self.capacity
+        return self.data[offset:offset + (end - start)]
+
+class AudioBuffer:
+    def __init__(self, settings: Optional[dict] = None, noise_floor: Optional[float] = None):
+        settings = settings or {}
+        self.vad = create_vad(settings)
+        self.silence_threshold = settings.get("sensitivity", 0.001)
+        # With auto_threshold the tracker replaces the manual sensitivity
+        self.auto_threshold = settings.get("auto_threshold", True)
+        self.noise = NoiseFloorTracker(settings, noise_floor)
+        self.silence_duration = 1
+        self.min_speech_duration = 0.064
+        # Utterances with less voiced audio or a peak this close to the floor are rejected as noise
+        self.min_voiced_frames = round(settings.get("min_voiced_ms", 150) / 1000 * SAMPLE_RATE / VAD_FRAME_SIZE)
+        self.reject_snr = settings.get("reject_snr", 2.0)
+        # Audio kept before speech onset and after the last speech frame
+        self.pre_roll = int(settings.get("pre_roll_ms", 300) * SAMPLE_RATE / 1000)
+        self.max_utterance = int(settings.get("max_utterance_s", 30) * SAMPLE_RATE)
+        # One spare second so an utterance is never overwritten while it is being read
+        self.margin = SAMPLE_RATE
+        self.ring = AudioRingBuffer(self.pre_roll + self.max_utterance + self.margin)
+        self.last_audio_level = 0
+        self.vad_pos = 0  # Next sample to be classified by the VAD
+        # Classified frames, as (is_speech, rms) pairs, that the utterance logic hasn't consumed yet
+        self.decided = deque()
+        self.frame_pos = 0  # End of the frames the utterance logic has consumed
+        self.processed_pos = 0  # End of the samples handled by process()
+        self.chunk_start = 0
+        self.speech_end = 0  # End of the last frame classified as speech
+        self.last_utterance_end = 0
+        self.overrun_samples = 0
+        self.started = False
+        self.clear()
+
+    def write(self, audio_data):
+        """Append 16 kHz samples; called from the same thread as process()"""
+        self.ring.write(audio_data)
+
+    def get_audio(self):
+        """Zero-copy view of the current utterance, valid until the ring wraps over it"""
+        if self.utterance_start is None:
+            return None
+        end = self.utterance_end if self.utterance_end is not None else self.processed_pos
+        if end <= self.utterance_start:
+            return None
+        return self.ring.view(self.utterance_start, end)
+
+    def get_chunk(self):
+        """Zero-copy view of the utterance audio added by the last process() call"""
+        if self.utterance_start is None:
+            return None
+        start = self.utterance_start if self.started else max(self.chunk_start, self.utterance_start)
+        end = self.utterance_end if self.utterance_end is not None else self.processed_pos
+        if end <= start:
+            return None
+        return self.ring.view(start, end)
+
+    def clear(self):
+        self.utterance_start = None
+        self.utterance_end = None
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self.voiced_frames = 0
+        self.peak_rms = 0.0
+        self.is_recording_speech = False
+
+    def rejection_reason(self):
+        """Why the finished utterance looks like noise rather than speech, or None if it should be decoded"""
+        if self.voiced_frames < self.min_voiced_frames:
+            return f"only {self.voiced_frames * VAD_FRAME_SIZE * 1000 // SAMPLE_RATE} ms voiced"
+        if self.noise.floor and self.peak_rms < self.noise.floor * self.reject_snr:
+            return f"peak {self.peak_rms:.4f} too close to noise floor {self.noise.floor:.4f}"
+        return None
+
+    def process(self, audio_data=None):
+        """Run VAD over newly written samples; returns their RMS and whether an utterance ended"""
+        if audio_data is not None:
+            self.write(audio_data)
+        end = self.ring.write_pos
+        oldest = end - self.ring.capacity + self.margin
+        if self.vad_pos < oldest:
+            # The consumer fell behind by more than the ring holds
+            self.overrun_samples += oldest - self.vad_pos
+            METRICS.increment("dropped_samples", oldest - self.vad_pos)
+            self.vad_pos = self.processed_pos = self.frame_pos = oldest
+            self.decided.clear()
+            if self.utterance_start is not None:
+                self.utterance_start = max(self.utterance_start, oldest)
+
+        self.chunk_start = self.processed_pos
+        self.processed_pos = end
+        self.started = False
+        chunk = self.ring.view(self.chunk_start, end)
+        rms = float(np.sqrt(np.mean(np.square(chunk)))) if len(chunk) else 0.0
+
+        count = (end - self.vad_pos) // VAD_FRAME_SIZE
+        frames = self.ring.view(self.vad_pos, self.vad_pos + count * VAD_FRAME_SIZE).reshape(count, VAD_FRAME_SIZE)
+        self.vad_pos += count * VAD_FRAME_SIZE
+
+        frame_duration = VAD_FRAME_SIZE / SAMPLE_RATE
+        min_speech_frames = max(1, round(self.min_speech_duration / frame_duration))
+        hangover_frames = max(1, round(self.silence_duration / frame_duration))
+
+        should_process = False
+        if count:
+            # Each frame is classified exactly once: Silero and spectral flux carry state between frames
+            with METRICS.span("vad"):
+                frame_levels = frame_rms(frames)
+                self.noise.update(frame_levels)
+                if self.auto_threshold:
+                    self.silence_threshold = self.noise.threshold()
+                decisions = self.vad.is_speech(frames, self.silence_threshold)
+            self.decided.extend(zip(decisions, frame_levels.tolist()))
+            METRICS.set_gauge("noise_floor", self.noise.floor)
+        while self.decided:
+            is_speech, level = self.decided.popleft()
+            self.frame_pos += VAD_FRAME_SIZE
+            frame_end = self.frame_pos
+            if is_speech:
+                self.voiced_frames += 1
+                self.peak_rms = max(self.peak_rms, level)
+                self.speech_frames += 1
+                self.silence_frames = 0
+                self.speech_end = frame_end
+                if not self.is_recording_speech and self.speech_frames >= min_speech_frames:
+                    onset = frame_end - self.speech_frames * VAD_FRAME_SIZE
+                    self.utterance_start = max(onset - self.pre_roll, self.last_utterance_end, oldest)
+                    self.utterance_end = None
+                    self.is_recording_speech = True
+                    self.started = True
+                    log.debug("Speech started")
+            else:
+                self.speech_frames = 0
+                if self.is_recording_speech:
+                    self.silence_frames += 1
+                    if self.silence_frames >= hangover_frames:
+                        should_process = True
+                        self.utterance_end = min(frame_end, self.speech_end + self.pre_roll)
+                        log.debug(f"Processing after {self.silence_duration}s of silence")
+                else:
+                    # Blips that never became an utterance don't count towards the next one
+                    self.voiced_frames = 0
+                    self.peak_rms = 0.0
+
+            if self.is_recording_speech and not should_process and frame_end - self.utterance_start >= self.max_utterance:
+                should_process = True
+                self.utterance_end = frame_end
+                log.debug("Maximum utterance length reached")
+
+            if should_process:
+                # The remaining decisions stay queued for the next call so they start a fresh utterance
+                self.is_recording_speech = False
+                self.last_utterance_end = self.utterance_end
+                break
+
+        return rms, should_process
+
+# Languages Whisper can transcribe, by code
+LANGUAGES = {
+    "en": "English", "zh": "Chinese", "de": "German", "es": "Spanish", "ru": "Russian", "ko": "Korean",
+    "fr": "French", "ja": "Japanese", "pt": "Portuguese", "tr": "Turkish", "pl": "Polish", "ca": "Catalan",
+    "nl": "Dutch", "ar": "Arabic", "sv": "Swedish", "it": "Italian", "id": "Indonesian", "hi": "Hindi",
+    "fi": "Finnish", "vi": "Vietnamese", "he": "Hebrew", "uk": "Ukrainian", "el": "Greek", "ms": "Malay",
+    "cs": "Czech", "ro": "Romanian", "da": "Danish", "hu": "Hungarian", "ta": "Tamil", "no": "Norwegian",
+    "th": "Thai", "ur": "Urdu", "hr": "Croatian", "bg": "Bulgarian", "lt": "Lithuanian", "la": "Latin",
+    "mi": "Maori", "ml": "Malayalam", "cy": "Welsh", "sk": "Slovak", "te": "Telugu", "fa": "Persian",
+    "lv": "Latvian", "bn": "Bengali", "sr": "Serbian", "az": "Azerbaijani", "sl": "Slovenian",
+    "kn": "Kannada", "et": "Estonian", "mk": "Macedonian", "br": "Breton", "eu": "Basque", "is": "Icelandic",
+    "hy": "Armenian", "ne": "Nepali", "mn": "Mongolian", "bs": "Bosnian", "kk": "Kazakh", "sq": "Albanian",
+    "sw": "Swahili", "gl": "Galician", "mr": "Marathi", "pa": "Punjabi", "si": "Sinhala", "km": "Khmer",
+    "sn": "Shona", "yo": "Yoruba", "so": "Somali", "af": "Afrikaans", "oc": "Occitan", "ka": "Georgian",
+    "be": "Belarusian", "tg": "Tajik", "sd": "Sindhi", "gu": "Gujarati", "am": "Amharic", "yi": "Yiddish",
+    "lo": "Lao", "uz": "Uzbek", "fo": "Faroese", "ht": "Haitian Creole", "ps": "Pashto", "tk": "Turkmen",
+    "nn": "Nynorsk", "mt": "Maltese", "sa": "Sanskrit", "lb": "Luxembourgish", "my": "Myanmar",
+    "bo": "Tibetan", "tl": "Tagalog", "mg": "Malagasy", "as": "Assamese", "tt": "Tatar", "haw": "Hawaiian",
+    "ln": "Lingala", "ha": "Hausa", "ba": "Bashkir", "jw": "Javanese", "su": "Sundanese", "yue": "Cantonese"
+}
+
+def language_name(code: str):
+    return "Auto-detect" if code == "auto" else LANGUAGES.get(code, code)
+
+class LanguageSelector:
+    """Resolves the decode language, detecting it once per window when the setting is "auto".
+
+    A detected language is cached for language_detect_window_s seconds so a
+    session pays for detection once instead of on every utterance. When
+    "languages" lists candidates, detection picks the most likely of them.
+    """
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.detected = None
+        self.detected_at = 0.0
+        self.lock = threading.Lock()
+        self.detect_lock = threading.Lock()  # One detection at a time; the others reuse its result
+
+    def candidates(self):
+        return [code for code in self.settings.get("languages", []) if code in LANGUAGES]
+
+    def cached(self):
+        with self.lock:
+            window = self.settings.get("language_detect_window_s", 300.0)
+            if self.detected and time.monotonic() - self.detected_at < window:
+                return self.detected
+        return None
+
+    def reset(self):
+        """Forget the detected language, e.g. after the user switches languages"""
+        with self.lock:
+            self.detected = None
+
+    def resolve(self, model, audio_data):
+        """Language to decode with, or None to let transcribe() detect it and report back via observe()"""
+        language = self.settings.get("language", "en")
+        if language != "auto":
+            return language
+        cached = self.cached()
+        if cached or not hasattr(model, "detect_language"):
+            return cached
+        with self.detect_lock:
+            cached = self.cached()
+            if cached:
+                return cached
+            with METRICS.span("language_detect"):
+                language, probability, all_probabilities = model.detect_language(audio_data)
+            candidates = [(code, p) for code, p in all_probabilities if code in self.candidates()]
+            if candidates:
+                # Confidence relative to the other candidates, not to every language
+                language, best = max(candidates, key=lambda item: item[1])
+                probability = best / max(sum(p for _, p in candidates), 1e-9)
+            self.observe(language, probability)
+            return language
+
+    def observe(self, language: Optional[str], probability: float = 1.0):
+        """Cache a detected language if detection was confident enough; returns True when it changed"""
+        if not language or probability < self.settings.get("language_detect_threshold", 0.5):
+            return False
+        with self.lock:
+            changed = language != self.detected
+            self.detected = language
+            self.detected_at = time.monotonic()
+        if changed:
+            log.info(f"Detected language: {language_name(language)} ({probability:.2f})")
+        return changed
+
+def transcribe_audio(model, audio_data, settings: dict, **options):
+    """Decode one segmented utterance with the configured options; returns (segments, info)"""
+    language = options.pop("language", settings.get("language"))
+    segments, info = model.transcribe(
+        audio_data,
+        language=None if language == "auto" else language,
+        # Speech was already segmented by the capture-side VAD
+        vad_filter=False,
+        **options
+    )
+    # transcribe() decodes lazily, so materialize the segments inside the caller's timing span
+    return list(segments), info
+
+class PromptContext:
+    """Decoder prompt built from the tail of recently typed text plus the user's hotwords.
+
+    Each piece of text is tokenized once when it is added, and the assembled
+    prompt is cached until the text or the hotwords change. Token ids are
+    passed to the decoder directly, so nothing is re-tokenized per utterance.
+    """
+    # Whisper keeps at most 223 prompt tokens
+    MAX_TOKENS = 223
+
+    def __init__(self, settings: dict, tokenizer=None):
+        self.settings = settings
+        self.tokenizer = tokenizer  # The model's hf_tokenizer; without one the prompt is plain text
+        self.recent = deque(maxlen=32)  # (text, token ids) of typed utterances, oldest first
+        self.hotwords = None
+        self.hotword_tokens = []
+        self.prompt = None
+        self.lock = threading.Lock()
+
+    def encode(self, text: str):
+        if self.tokenizer is None:
+            # Rough budget of four characters per token
+            return [None] * max(1, len(text) // 4)
+        return self.tokenizer.encode(" " + text.strip(), add_special_tokens=False).ids
+
+    def add(self, text: str):
+        """Record text that was just typed"""
+        text = text.strip()
+        if not text:
+            return
+        tokens = self.encode(text)
+        with self.lock:
+            self.recent.append((text, tokens))
+            self.prompt = None
+
+    def clear(self):
+        with self.lock:
+            self.recent.clear()
+            self.prompt = None
+
+    def build(self):
+        """Prompt for the next decode: token ids, text without a tokenizer, or None"""
+        hotwords = tuple(word.strip() for word in self.settings.get("hotwords", []) if word.strip())
+        with self.lock:
+            if hotwords != self.hotwords:
+                self.hotwords = hotwords
+                self.hotword_tokens = self.encode(", ".join(hotwords) + ".") if hotwords else []
+                self.prompt = None
+            if self.prompt is not None:
+                return self.prompt or None
+
+            budget = min(self.settings.get("prompt_token_budget", 128), self.MAX_TOKENS)
+            # Hotwords come first, but never past the budget: whole hotwords are dropped from the end until they fit
+            kept = list(hotwords)
+            hotword_tokens = self.hotword_tokens
+            while kept and len(hotword_tokens) > budget:
+                kept.pop()
+                hotword_tokens = self.encode(", ".join(kept) + ".") if kept else []
+            hotword_text = ", ".join(kept) + "." if kept else ""
+            remaining = budget - len(hotword_tokens)
+            texts, tokens = [], []
+            for text, text_tokens in reversed(self.recent):
+                if remaining <= 0:
+                    break
+                if len(text_tokens) > remaining:
+                    # Keep the end of the oldest piece that still fits
+                    tokens = text_tokens[-remaining:] + tokens
+                    # Cut at a word boundary so the prompt doesn't start with half a word
+                    tail = text[-remaining * 4 - 1:].split(" ", 1)
+                    if len(tail) > 1 and tail[1]:
+                        texts.insert(0, tail[1])
+                    break
+                tokens = text_tokens + tokens
+                texts.insert(0, text)
+                remaining -= len(text_tokens)
+
+            if self.tokenizer is None:
+                parts = ([hotword_text] if hotword_text else []) + texts
+                self.prompt = " ".join(parts)
+            else:
+                self.prompt = hotword_tokens + tokens
+            return self.prompt or None
+
+def replace_words(segment, words):
+    """Copy of a decoded segment with new words and the text they spell"""
+    fields = segment._asdict() if hasattr(segment, "_asdict") else dict(vars(segment))
+    fields.update(words=words, text="".join(word.word for word in words))
+    return types.SimpleNamespace(**fields)
+
+def segment_records(segments, offset: float = 0.0):
+    """JSON-ready [start, end, text, words] per segment; words are [start, end, word, probability]"""
+    return [[
+        round(offset + segment.start, 3), round(offset + segment.end, 3), segment.text.strip(),
+        [[round(offset + word.start, 3), round(offset + word.end, 3), word.word.strip(), round(word.probability, 3)]
+         for word in segment.words or []]
+    ] for segment in segments]
+
+DECODING_PROFILES = {
+    "fast": dict(beam_size=1, best_of=1, temperature=0.0),
+    "accurate": dict(beam_size=5, best_of=5, temperature=[0.0, 0.2, 0.4, 0.6, 0.8, 1.0])
+}
+
+class DecodingPolicy:
+    """Picks a decoding profile per utterance: greedy first, beam search when the result looks poor.
+
+    In "auto" mode utterances are decoded greedily. Runs of words below
+    redecode_word_probability are re-decoded with beam search on just their
+    slice of the audio; the whole utterance is re-decoded instead when a
+    segment's avg_logprob or compression_ratio crosses the fallback
+    thresholds and the weak words cover most of it. Re-decodes only happen
+    if the queue isn't backed up and the estimated beam decode fits
+    latency_target_ms. Long utterances go straight to beam search when it
+    fits the target.
+    """
+    def __init__(self, settings: dict):
+        self.settings = settings
+        # Seconds of decoding per second of audio, learned from completed decodes
+        self.rtf = {"fast": 0.1, "accurate": 0.3}
+        self.lock = threading.Lock()
+
+    def options(self, profile: str):
+        options = dict(DECODING_PROFILES[profile])
+        if profile == "accurate":
+            options["beam_size"] = options["best_of"] = self.settings.get("beam_size", 5)
+        options["word_timestamps"] = self.settings.get("word_timestamps", True)
+        return options
+
+    def estimate(self, profile: str, duration: float):
+        with self.lock:
+            return self.rtf[profile] * duration
+
+    def choose(self, duration: float, queue_depth: int):
+        profile = self.settings.get("decoding_profile", "auto")
+        if profile in DECODING_PROFILES:
+            return profile
+        target = self.settings.get("latency_target_ms", 1000) / 1000
+        if (queue_depth <= 1 and duration >= self.settings.get("long_utterance_s", 10.0)
+                and self.estimate("accurate", duration) <= target):
+            return "accurate"
+        return "fast"
+
+    def is_poor(self, segments):
+        logprob_threshold = self.settings.get("fallback_logprob", -0.8)
+        compression_threshold = self.settings.get("fallback_compression_ratio", 2.4)
+        return any(
+            segment.avg_logprob < logprob_threshold or segment.compression_ratio > compression_threshold
+            for segment in segments
+        )
+
+    def low_confidence_spans(self, segments):
+        """(segment index, first word, last word) for each run of words below redecode_word_probability"""
+        threshold = self.settings.get("redecode_word_probability", 0.5)
+        spans = []
+        for index, segment in enumerate(segments):
+            run = None
+            for i, word in enumerate(segment.words or []):
+                if word.probability < threshold:
+                    run = (i, i) if run is None else (run[0], i)
+                elif run is not None:
+                    spans.append((index,) + run)
+                    run = None
+            if run is not None:
+                spans.append((index,) + run)
+        return spans
+
+    def redecode_spans(self, model, audio_data, segments, spans, language=None):
+        """Re-decode only the audio around each span with beam search, keeping words that come out more confident"""
+        padding = self.settings.get("redecode_padding_s", 0.5)
+        duration = len(audio_data) / SAMPLE_RATE
+        segments = list(segments)
+        # Back to front, so replacing words never shifts the indices of spans still to do
+        for index, first, last in reversed(spans):
+            words = list(segments[index].words)
+            start, end = words[first].start, words[last].end
+            slice_start, slice_end = max(0.0, start - padding), min(duration, end + padding)
+            audio_slice = audio_data[int(slice_start * SAMPLE_RATE):int(slice_end * SAMPLE_RATE)]
+            # The words before the span give the decoder its context
+            context = " ".join(segment.text.strip() for segment in segments[:index])
+            prompt = (context + "".join(word.word for word in words[:first])).strip() or None
+            with METRICS.span("redecode"):
+                decoded, _ = self.decode(model, audio_slice, "accurate", prompt, language)
+            METRICS.increment("redecoded_spans")
+            replacement = [
+                types.SimpleNamespace(start=slice_start + word.start, end=slice_start + word.end,
+                                      word=word.word, probability=word.probability)
+                for segment in decoded for word in segment.words or []
+                if start - 0.1 <= slice_start + (word.start + word.end) / 2 <= end + 0.1
+            ]
+            old_confidence = np.mean([word.probability for word in words[first:last + 1]])
+            if replacement and np.mean([word.probability for word in replacement]) > old_confidence:
+                METRICS.increment("redecode_improved")
+                words[first:last + 1] = replacement
+                segments[index] = replace_words(segments[index], words)
+        return segments
+
+    def decode(self, model, audio_data, profile: str, initial_prompt=None, language=None):
+        started = time.perf_counter()
+        segments, info = transcribe_audio(model, audio_data, self.settings, initial_prompt=initial_prompt,
+                                          language=language, **self.options(profile))
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.rtf[profile] = 0.8 * self.rtf[profile] + 0.2 * elapsed / max(len(audio_data) / SAMPLE_RATE, 0.1)
+        METRICS.increment(f"decode_profile_{profile}")
+        return segments, info
+
+    def transcribe(self, model, audio_data, queue_depth: int = 0, initial_prompt=None, language=None):
+        """Decode with the chosen profile, falling back to beam search when needed; returns (segments, info)"""
+        duration = len(audio_data) / SAMPLE_RATE
+        profile = self.choose(duration, queue_depth)
+        segments, info = self.decode(model, audio_data, profile, initial_prompt, language)
+        if profile != "fast" or self.settings.get("decoding_profile", "auto") != "auto" or queue_depth > 1:
+            return segments, info
+
+        target = self.settings.get("latency_target_ms", 1000) / 1000
+        spans = self.low_confidence_spans(segments)
+        weak = sum(segments[i].words[last].end - segments[i].words[first].start for i, first, last in spans)
+        if self.is_poor(segments) and (not spans or weak > self.settings.get("redecode_max_fraction", 0.5) * duration):
+            if self.estimate("accurate", duration) <= target:
+                log.debug("Low-confidence greedy result, re-decoding with beam search")
+                METRICS.increment("decode_fallbacks")
+                segments, info = self.decode(model, audio_data, "accurate", initial_prompt, info.language)
+        elif spans:
+            # Beam search still runs the encoder over a full window, so short slices cost at least a second
+            padding = 2 * self.settings.get("redecode_padding_s", 0.5)
+            cost = sum(self.estimate("accurate", max(1.0, segments[i].words[last].end
+                                                     - segments[i].words[first].start + padding))
+                       for i, first, last in spans)
+            if cost <= target:
+                log.debug(f"Re-decoding {len(spans)} low-confidence span(s) with beam search")
+                segments = self.redecode_spans(model, audio_data, segments, spans, info.language)
+        return segments, info
+
+class Transcript:
+    """Text produced by one decode, with the timing needed for end-to-end latency"""
+    def __init__(self, text: str, speech_end: Optional[float] = None, language: Optional[str] = None,
+                 segments=None, confidence: Optional[float] = None, audio=None, speech_ends=None):
+        self.text = text
+        self.speech_end = speech_end  # time.perf_counter() when the speech ended
+        # When several utterances were decoded together, when each of them ended
+        self.speech_ends = speech_ends or ([speech_end] if speech_end is not None else [])
+        self.language = language
+        self.segments = segments or []  # [start, end, text, words] as built by segment_records()
+        self.confidence = confidence  # See segment_confidence()
+        self.audio = audio  # The decoded audio, kept only until the history has stored it
+
+def segment_confidence(segments):
+    """Mean word probability of decoded segments, or their duration-weighted token probability without words"""
+    probabilities = [word.probability for segment in segments for word in segment.words or []]
+    if probabilities:
+        return float(np.mean(probabilities))
+    weights = [max(segment.end - segment.start, 0.01) for segment in segments]
+    if not weights:
+        return None
+    return float(np.exp(sum(w * segment.avg_logprob for w, segment in zip(weights, segments)) / sum(weights)))
+
+class InferenceJob:
+    """One decode request: a single utterance or several short ones merged together"""
+    def __init__(self, seq: int, audio_data, speech_end: Optional[float] = None):
+        self.seq = seq
+        self.chunks = [audio_data]
+        self.samples = len(audio_data)
+        self.speech_ends = [speech_end] if speech_end is not None else []
+        self.submitted = time.perf_counter()
+
+    @property
+    def speech_end(self):
+        return self.speech_ends[0] if self.speech_ends else None
+
+    def append(self, audio_data, speech_end: Optional[float] = None):
+        self.chunks.append(audio_data)
+        self.samples += len(audio_data)
+        if speech_end is not None:
+            self.speech_ends.append(speech_end)
+
+    def get_audio(self, gap_samples: int):
+        """Join merged utterances with a short pause so Whisper sees the boundary"""
+        if len(self.chunks) == 1:
+            return self.chunks[0]
+        gap = np.zeros(gap_samples, dtype=np.float32)
+        parts = [self.chunks[0]]
+        for chunk in self.chunks[1:]:
+            parts.extend([gap, chunk])
+        return np.concatenate(parts)
+
+class InferenceScheduler:
+    """Runs queued utterances concurrently across the model's workers and emits their text in order.
+
+    Short utterances that are still waiting for a worker are merged into a
+    single decode. When max_pending jobs are queued, new utterances are
+    merged into the last job instead, up to batch_max, so capture never
+    blocks and no speech is dropped.
+    """
+    def __init__(self, text_queue: queue.Queue, status_queue: queue.Queue, settings: dict, model,
+                 stop_event: threading.Event, prompt_context: Optional[PromptContext] = None,
+                 languages: Optional[LanguageSelector] = None):
+        self.text_queue = text_queue
+        self.status_queue = status_queue
+        self.settings = settings
+        self.model = model
+        self.stop_event = stop_event
+        self.plan = ResourcePlan(settings)
+        self.num_workers = max(1, settings.get("inference_workers") or self.plan.num_workers)
+        self.max_pending = settings.get("max_pending_utterances", 8)
+        self.batch_short = int(settings.get("batch_short_s", 3.0) * SAMPLE_RATE)
+        self.batch_max = int(settings.get("batch_max_s", 15.0) * SAMPLE_RATE)
+        self.gap_samples = int(0.3 * SAMPLE_RATE)
+        self.policy = DecodingPolicy(settings)
+        self.prompt_context = prompt_context or PromptContext(settings, getattr(model, "hf_tokenizer", None))
+        self.languages = languages or LanguageSelector(settings)
+        self.pending = deque()
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.next_seq = 0
+        self.next_emit = 0
+        self.results = {}
+        self.workers = [threading.Thread(target=self.worker_loop, daemon=True) for _ in range(self.num_workers)]
+
+    @property
+    def queue_depth(self):
+        """Utterance jobs waiting for or running on a worker"""
+        return len(self.pending) + self.in_flight
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, audio_data, speech_end: Optional[float] = None):
+        with self.condition:
+            last = self.pending[-1] if self.pending else None
+            # A merged job never grows past batch_max; beyond that a new job is queued even under backpressure
+            if last is not None and last.samples + len(audio_data) <= self.batch_max and (
+                len(self.pending) >= self.max_pending or len(audio_data) <= self.batch_short
+            ):
+                last.append(audio_data, speech_end)
+            else:
+                self.pending.append(InferenceJob(self.next_seq, audio_data, speech_end))
+                self.next_seq += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            depth = self.queue_depth
+            self.condition.notify()
+        METRICS.set_gauge("queue_depth", depth)
+        if depth > 1:
+            self.status_queue.put((f"Processing speech... ({depth} queued)", "blue"))
+
+    def close(self):
+        """Finish the queued jobs in the background, then let the workers exit"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def worker_loop(self):
+        # Feature extraction runs on this thread, so it gets the same placement as the model's threads
+        self.plan.apply()
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                job = self.pending.popleft()
+                self.in_flight += 1
+            METRICS.observe("queue_wait", time.perf_counter() - job.submitted)
+            transcript = self.transcribe(job)
+            with self.condition:
+                self.in_flight -= 1
+                depth = self.queue_depth
+            METRICS.set_gauge("queue_depth", depth)
+            self.emit(job.seq, transcript)
+            if depth == 0 and not self.stop_event.is_set():
+                self.status_queue.put(("Status: Recording", "green"))
+
+    def emit(self, seq: int, transcript: Transcript):
+        """Release results strictly in submission order, whichever worker finished first"""
+        with self.condition:
+            self.results[seq] = transcript
+            while self.next_emit in self.results:
+                ready = self.results.pop(self.next_emit)
+                self.next_emit += 1
+                if ready.text:
+                    self.prompt_context.add(ready.text)
+                    self.text_queue.put(ready)
+
+    def transcribe(self, job: InferenceJob):
+        self.status_queue.put(("Processing speech...", "blue"))
+        audio_data = job.get_audio(self.gap_samples)
+        log.debug(f"Transcribing {len(job.chunks)} utterance(s), {len(audio_data)} samples")
+        try:
+            language = self.languages.resolve(self.model, audio_data)
+            with METRICS.span("decode"):
+                segments, info = self.policy.transcribe(self.model, audio_data, self.queue_depth,
+                                                        self.prompt_context.build(), language)
+            if language is None:
+                language = info.language
+                if self.languages.observe(language, info.language_probability):
+                    self.status_queue.put((f"Detected language: {language_name(language)}", "blue"))
+            text = " ".join([segment.text for segment in segments]).strip()
+            METRICS.increment("audio_seconds_decoded", len(audio_data) / SAMPLE_RATE)
+            probabilities = [word.probability for segment in segments for word in segment.words or []]
+            METRICS.increment("words_decoded", len(probabilities))
+            METRICS.increment("low_confidence_words", sum(
+                p < self.settings.get("redecode_word_probability", 0.5) for p in probabilities))
+        except Exception as e:
+            log.error(f"Transcription error: {str(e)}")
+            self.status_queue.put((f"Transcription error: {str(e)}", "red"))
+            return Transcript("", job.speech_end, speech_ends=job.speech_ends)
+        log.debug(f"Transcribed text: {text}")
+        return Transcript(
+            text, job.speech_end, language,
+            segments=segment_records(segments),
+            confidence=segment_confidence(segments),
+            audio=audio_data,
+            speech_ends=job.speech_ends
+        )
+
+def _normalize_word(word: str):
+    return word.strip().lower().strip(".,!?;:\"'")
+
+class StreamingTranscriber:
+    """Incremental decoder that commits the words two consecutive decodes agree on (local agreement)"""
+    def __init__(self, model, settings: dict, sample_rate=16000, prompt_context: Optional[PromptContext] = None,
+                 languages: Optional[LanguageSelector] = None):
+        self.model = model
+        self.settings = settings
+        self.languages = languages or LanguageSelector(settings)
+        self.language = None  # Language of the last decode
+        self.sample_rate = sample_rate
+        self.window = settings.get("stream_window_s", 15.0)
+        # Committed words feed the decoder prompt across windows and utterances
+        self.context = prompt_context or PromptContext(settings, getattr(model, "hf_tokenizer", None))
+        self.reset()
+
+    def reset(self):
+        """Drop the per-utterance audio and hypothesis, keeping the prompt context"""
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.audio_offset = 0.0  # Seconds trimmed from the front of self.audio
+        self.committed = []  # (start, end, word) committed in the current utterance
+        self.hypothesis = []  # Uncommitted tail of the previous decode
+
+    def insert_audio(self, audio_data):
+        self.audio = np.concatenate([self.audio, audio_data])
+
+    def decode(self):
+        """Decode the current window, returning words with absolute timestamps"""
+        language = self.languages.resolve(self.model, self.audio)
+        segments, info = self.model.transcribe(
+            self.audio,
+            language=language,
+            beam_size=1,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=self.context.build()
+        )
+        words = []
+        for segment in segments:
+            for word in segment.words or []:
+                if word.word.strip():
+                    words.append((self.audio_offset + word.start, self.audio_offset + word.end, word.word.strip(),
+                                  word.probability))
+        if language is None:
+            self.languages.observe(info.language, info.language_probability)
+        self.language = language or info.language
+        return words
+
+    def process(self):
+        """Decode the window and return the newly committed (start, end, word) tuples"""
+        words = self.decode()
+        last_end = self.committed[-1][1] if self.committed else self.audio_offset
+        words = [w for w in words if w[0] > last_end - 0.1]
+
+        # Drop words at the window start that repeat the tail of what is already committed
+        if words and self.committed and abs(words[0][0] - last_end) < 1:
+            for n in range(min(len(self.committed), len(words), 5), 0, -1):
+                tail = [_normalize_word(w[2]) for w in self.committed[-n:]]
+                head = [_normalize_word(w[2]) for w in words[:n]]
+                if tail == head:
+                    words = words[n:]
+                    break
+
+        committed = []
+        for new, old in zip(words, self.hypothesis):
+            if _normalize_word(new[2]) != _normalize_word(old[2]):
+                break
+            committed.append(new)
+        self.hypothesis = words[len(committed):]
+
+        # Never let the window grow without bound, even if decodes keep disagreeing
+        if len(self.audio) > 2 * self.window * self.sample_rate:
+            committed.extend(self.hypothesis)
+            self.hypothesis = []
+
+        self.commit(committed)
+        return committed
+
+    def finish(self):
+        """Decode the remaining audio of an utterance and commit everything left"""
+        committed = self.process() if len(self.audio) else []
+        committed.extend(self.hypothesis)
+        self.commit(self.hypothesis)
+        self.reset()
+        return committed
+
+    def commit(self, words):
+        self.committed.extend(words)
+        self.context.add(" ".join(w[2] for w in words))
+        # Keep the audio window compact by trimming everything before the last committed word
+        if self.committed and len(self.audio) > self.window * self.sample_rate:
+            cut_time = self.committed[-1][1]
+            cut = int((cut_time - self.audio_offset) * self.sample_rate)
+            if cut > 0:
+                self.audio = self.audio[cut:]
+                self.audio_offset = cut_time
+
+class StreamingWorker(threading.Thread):
+    """Decodes speech while it is still being spoken and emits only newly committed words"""
+    def __init__(self, segment_queue: queue.Queue, text_queue: queue.Queue, status_queue: queue.Queue,
+                 settings: dict, model, stop_event: threading.Event, prompt_context: Optional[PromptContext] = None,
+                 languages: Optional[LanguageSelector] = None):
+        super().__init__()
+        self.segment_queue = segment_queue
+        self.text_queue = text_queue
+        self.status_queue = status_queue
+        self.settings = settings
+        self.transcriber = StreamingTranscriber(model, settings, prompt_context=prompt_context, languages=languages)
+        self.step = settings.get("stream_step_ms", 500) / 1000
+        self.stop_event = stop_event
+        # (seconds into the utterance, time.perf_counter() when captured) at the end of each audio chunk
+        self.captures = []
+        self.daemon = True
+
+    def capture_time(self, offset: float):
+        """When the audio at offset seconds into the current utterance was captured, or None"""
+        if not self.captures:
+            return None
+        index = min(bisect.bisect_left(self.captures, (offset,)), len(self.captures) - 1)
+        end, captured = self.captures[index]
+        return captured - (end - offset)
+
+    def run(self):
+        pending = 0.0  # Seconds of audio received since the last decode
+        done = False
+        while not done:
+            messages = [self.segment_queue.get()]
+            # Everything that arrived while the previous decode ran is handled in one pass
+            while True:
+                try:
+                    messages.append(self.segment_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for message in messages:
+                if message is None:
+                    done = True
+                    break
+                kind, audio_data, captured = message
+                if kind == "audio":
+                    self.transcriber.insert_audio(audio_data)
+                    received = self.captures[-1][0] if self.captures else 0.0
+                    self.captures.append((received + len(audio_data) / self.transcriber.sample_rate, captured))
+                    pending += len(audio_data) / self.transcriber.sample_rate
+                elif kind == "end":
+                    self.emit(self.transcriber.finish)
+                    self.captures = []
+                    pending = 0.0
+
+            if done:
+                self.emit(self.transcriber.finish)
+                self.captures = []
+            elif pending >= self.step:
+                self.emit(self.transcriber.process)
+                pending = 0.0
+
+    def emit(self, decode):
+        try:
+            with METRICS.span("decode"):
+                words = decode()
+        except Exception as e:
+            log.error(f"Streaming transcription error: {str(e)}")
+            self.status_queue.put((f"Transcription error: {str(e)}", "red"))
+            self.transcriber.reset()
+            self.captures = []
+            return
+        if words:
+            text = " ".join(w[2] for w in words)
+            records = [[round(w[0], 3), round(w[1], 3), w[2], round(w[3], 3)] for w in words]
+            # Latency counts from when the last committed word was spoken, not from when this decode began
+            self.text_queue.put(Transcript(text, self.capture_time(words[-1][1]), self.transcriber.language,
+                                           segments=[[records[0][0], records[-1][1], text, records]],
+                                           confidence=float(np.mean([w[3] for w in words]))))
+
+class AudioRecorder(threading.Thread):
+    def __init__(self, text_queue: queue.Queue, status_queue: queue.Queue, audio_level_queue: "LatestValue", settings: dict,
+                 languages: Optional[LanguageSelector] = None):
+        super().__init__()
+        self.text_queue = text_queue
+        self.status_queue = status_queue
+        self.audio_level_queue = audio_level_queue
+        self.settings = settings
+        # Owned by the caller so a detected language outlives a single recording
+        self.languages = languages or LanguageSelector(settings)
+        self.model = None
+        self.daemon = True
+        # 16 kHz audio for segmentation, filled by this thread from the capture ring below
+        self.audio_buffer = AudioBuffer(settings)
+        self.auto_gain = AutoGain(settings) if settings.get("agc", True) else None
+        self.device_name = None
+        # The callback copies native-rate interleaved samples here; this thread downmixes and resamples them
+        self.capture: Optional[AudioRingBuffer] = None
+        self.capture_pos = 0  # Next captured sample to convert
+        self.channels = 1
+        self.resampler: Optional[PolyphaseResampler] = None
+        self.data_ready = threading.Event()  # Set by the callback after each block
+        # Speech blocks for the streaming worker
+        self.segment_queue = queue.Queue()
+        self.streaming = settings.get("streaming", False)
+        self.inference_worker: Optional[StreamingWorker] = None
+        self.scheduler: Optional[InferenceScheduler] = None
+        self.prompt_context: Optional[PromptContext] = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def load_model(self):
+        if self.model is None and self.settings.get("use_server", False):
+            try:
+                self.model = connect_server(self.settings)
+                self.status_queue.put(("Status: Recording (server)", "green"))
+                return
+            except OSError as e:
+                log.warning(f"Transcription server unavailable, loading the model in-process: {str(e)}")
+        try:
+            if self.model is None:
+                key = ModelRegistry.key_from_settings(self.settings)
+                if not MODEL_REGISTRY.is_ready(key):
+                    self.status_queue.put(("Loading Whisper model...", "yellow"))
+                self.model = MODEL_REGISTRY.get(key)
+                self.status_queue.put(("Status: Recording", "green"))
+        except Exception as e:
+            self.status_queue.put((f"Error loading model: {str(e)}", "red"))
+            log.error(f"Model loading error details: {str(e)}")
+            self.stop_event.set()
+
+    def run(self):
+        log.debug("Starting AudioRecorder thread")
+        self.load_model()
+        if self.model is None:
+            log.debug("Model failed to load, exiting thread")
+            return
+
+        fallback_reason = getattr(self.audio_buffer.vad, "fallback_reason", None)
+        if fallback_reason:
+            self.status_queue.put((fallback_reason, "red"))
+
+        # Shared by both decode paths so typed text keeps biasing the next utterance
+        self.prompt_context = PromptContext(self.settings, getattr(self.model, "hf_tokenizer", None))
+        if self.streaming:
+            self.inference_worker = StreamingWorker(
+                self.segment_queue,
+                self.text_queue,
+                self.status_queue,
+                self.settings,
+                self.model,
+                self.stop_event,
+                self.prompt_context,
+                self.languages
+            )
+            self.inference_worker.start()
+        else:
+            self.scheduler = InferenceScheduler(
+                self.text_queue,
+                self.status_queue,
+                self.settings,
+                self.model,
+                self.stop_event,
+                self.prompt_context,
+                self.languages
+            )
+            self.scheduler.start()
+
+        def callback(indata, frames, time_info, status):
+            # Runs on the PortAudio thread: only copy the block into the ring, never block or allocate here
+            if self.stop_event.is_set():
+                raise sd.CallbackStop()
+            started = time.perf_counter()
+            if status.input_overflow:
+                METRICS.increment("overflowed_blocks")
+            self.capture.write(indata.reshape(-1))
+            self.data_ready.set()
+            METRICS.observe("capture", time.perf_counter() - started)
+
+        try:
+            load_heavy_modules(("sounddevice",))
+            device, sample_rate, channels, block_size = capture_config(self.settings)
+            self.resampler = PolyphaseResampler(sample_rate)
+            self.channels = channels
+            # Holds two seconds of backlog for this thread, plus as much again for the callback to write into
+            self.capture = AudioRingBuffer(4 * sample_rate * channels)
+            self.device_name = sd.query_devices(device, kind="input")["name"]
+            log.info(f"Capturing from {self.device_name} at {sample_rate} Hz, {channels} channel(s), "
+                     f"{block_size} frames per block")
+            # Start from the noise floor last measured on this device instead of learning it from scratch
+            noise_floor = self.settings.get("noise_floors", {}).get(self.device_name)
+            self.audio_buffer.noise = NoiseFloorTracker(self.settings, noise_floor)
+            with sd.InputStream(
+                device=device,
+                samplerate=sample_rate,
+                channels=channels,
+                dtype='float32',
+                blocksize=block_size,
+                latency=self.settings.get("capture_latency", "low"),
+                callback=callback
+            ):
+                log.debug("InputStream started")
+                while not self.stop_event.is_set():
+                    if not self.data_ready.wait(timeout=0.1):
+                        continue
+                    self.data_ready.clear()
+                    self.process_block()
+        except Exception as e:
+            log.error(f"Error in recording stream: {str(e)}")
+            self.status_queue.put((f"Recording error: {str(e)}", "red"))
+        finally:
+            self.flush()
+            if self.device_name and self.audio_buffer.noise.floor:
+                self.settings.setdefault("noise_floors", {})[self.device_name] = round(self.audio_buffer.noise.floor, 6)
+            if self.audio_buffer.overrun_samples:
+                log.warning(f"Dropped {self.audio_buffer.overrun_samples} audio samples")
+            # Let the workers finish queued utterances in the background
+            if self.scheduler:
+                log.info(f"Peak inference queue depth: {self.scheduler.max_queue_depth}")
+                self.scheduler.close()
+            else:
+                self.segment_queue.put(None)
+            if log.isEnabledFor(logging.INFO):
+                log.info(f"Metrics: {json.dumps(METRICS.snapshot())}")
+
+    def process_block(self):
+        """Segment newly captured audio and queue finished utterances for inference"""
+        self.convert_capture()
+        rms, should_process = self.audio_buffer.process()
+        # Send RMS and the threshold it is compared against to the GUI
+        self.audio_level_queue.put((rms, self.audio_buffer.silence_threshold))
+        if self.streaming:
+            chunk = self.audio_buffer.get_chunk()
+            if chunk is not None:
+                chunk = chunk.copy()
+                if self.auto_gain:
+                    self.auto_gain.stream(chunk, self.audio_buffer.noise.floor)
+                # When the chunk's last sample was captured, so committed words can be back-dated to it
+                buffer = self.audio_buffer
+                chunk_end = buffer.utterance_end if buffer.utterance_end is not None else buffer.processed_pos
+                captured = time.perf_counter() - (buffer.processed_pos - chunk_end) / SAMPLE_RATE
+                self.segment_queue.put(("audio", chunk, captured))
+        if should_process:
+            self.queue_utterance()
+
+    def queue_utterance(self):
+        if self.streaming:
+            self.segment_queue.put(("end", None, None))
+            self.audio_buffer.clear()
+            return
+        audio_data_combined = self.audio_buffer.get_audio()
+        rejection = self.audio_buffer.rejection_reason()
+        if audio_data_combined is not None and rejection:
+            log.debug(f"Rejected utterance: {rejection}")
+            METRICS.increment("rejected_utterances")
+        elif audio_data_combined is not None:
+            # Back-date to the last speech frame; the hangover silence is not decode latency
+            trailing = self.audio_buffer.processed_pos - self.audio_buffer.speech_end
+            speech_end = time.perf_counter() - trailing / SAMPLE_RATE
+            # The only copy an utterance makes: the worker may run after the ring has moved on
+            audio_data_combined = audio_data_combined.copy()
+            if self.auto_gain:
+                self.auto_gain.normalize(audio_data_combined, self.audio_buffer.noise.floor)
+            self.scheduler.submit(audio_data_combined, speech_end)
+        else:
+            log.debug("No audio data to process")
+        self.audio_buffer.clear()
+
+    def convert_capture(self):
+        """Downmix and resample what the callback captured since the last call into the 16 kHz buffer"""
+        if self.capture is None:
+            return
+        end = self.capture.write_pos
+        # Only the newest half is read, so the callback never overwrites a block while it is converted
+        oldest = end - self.capture.capacity // 2
+        if self.capture_pos < oldest:
+            dropped = (oldest - self.capture_pos) // self.channels * self.resampler.up // self.resampler.down
+            self.audio_buffer.overrun_samples += dropped
+            METRICS.increment("dropped_samples", dropped)
+            self.capture_pos = oldest
+        if end == self.capture_pos:
+            return
+        block = self.capture.view(self.capture_pos, end).reshape(-1, self.channels)
+        self.capture_pos = end
+        mono = block.mean(axis=1) if self.channels > 1 else block[:, 0]
+        self.audio_buffer.write(self.resampler.process(mono))
+
+    def flush(self):
+        """Queue any audio and speech still pending when recording stops"""
+        self.process_block()
+        if self.audio_buffer.is_recording_speech:
+            self.queue_utterance()
+
+    def stop(self):
+        """Signal the thread to stop"""
+        self.stop_event.set()
+
+class OutputBackend:
+    """Strategy for injecting text into whichever window has focus"""
+    def __init__(self, settings: dict):
+        self.settings = settings
+
+    def type_text(self, text: str, backlog: int = 0):
+        raise NotImplementedError
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+    _INPUT_KEYBOARD = 1
+    _KEYEVENTF_KEYUP = 0x0002
+    _KEYEVENTF_UNICODE = 0x0004
+
+    class _KEYBDINPUT(ctypes.Structure):
+        _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                    ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+    class _MOUSEINPUT(ctypes.Structure):
+        _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                    ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = [("ki", _KEYBDINPUT), ("mi", _MOUSEINPUT)]
+
+    class _INPUT(ctypes.Structure):
+        _fields_ = [("type", wintypes.DWORD), ("union", _INPUTUNION)]
+
+    def _send_unicode_input(text: str):
+        """Inject the whole string with a single SendInput call"""
+        units = np.frombuffer(text.encode("utf-16-le"), dtype=np.uint16)
+        inputs = (_INPUT * (2 * len(units)))()
+        for i, unit in enumerate(units):
+            for j, flags in enumerate((_KEYEVENTF_UNICODE, _KEYEVENTF_UNICODE | _KEYEVENTF_KEYUP)):
+                event = inputs[2 * i + j]
+                event.type = _INPUT_KEYBOARD
+                event.union.ki.wScan = int(unit)
+                event.union.ki.dwFlags = flags
+        sent = ctypes.windll.user32.SendInput(len(inputs), inputs, ctypes.sizeof(_INPUT))
+        if sent != len(inputs):
+            raise ctypes.WinError()
+
+class UnicodeStringBackend(OutputBackend):
+    """Injects the whole string at once: SendInput on Windows, one pynput call elsewhere"""
+    def type_text(self, text: str, backlog: int = 0):
+        if sys.platform == "win32":
+            _send_unicode_input(text)
+        else:
+            load_heavy_modules(("pynput.keyboard",))
+            kb.Controller().type(text)
+
+class ClipboardPasteBackend(OutputBackend):
+    """Pastes through the clipboard, restoring its previous contents afterwards"""
+    def type_text(self, text: str, backlog: int = 0):
+        load_heavy_modules(("pynput.keyboard", "pyperclip"))
+        try:
+            previous = pyperclip.paste()
+        except Exception:
+            previous = None
+        pyperclip.copy(text)
+        controller = kb.Controller()
+        modifier = Key.cmd if sys.platform == "darwin" else Key.ctrl
+        with controller.pressed(modifier):
+            controller.press("v")
+            controller.release("v")
+        # Give the target application time to read the clipboard before restoring it
+        time.sleep(self.settings.get("clipboard_restore_delay", 0.2))
+        if previous is not None:
+            pyperclip.copy(previous)
+
+class KeyEventBackend(OutputBackend):
+    """Types key by key, spreading short texts out and speeding up for long ones or a backlog"""
+    def type_text(self, text: str, backlog: int = 0):
+        max_interval = self.settings.get("typing_max_interval", 0.01)
+        budget = self.settings.get("typing_budget_s", 1.0)
+        interval = 0.0 if backlog else min(max_interval, budget / max(1, len(text)))
+        load_heavy_modules(("pynput.keyboard",))
+        controller = kb.Controller()
+        for char in text:
+            controller.type(char)
+            if interval:
+                time.sleep(interval)
+
+class StubBackend(OutputBackend):
+    """Records typed text instead of sending key events; used by tests and benchmarks"""
+    def __init__(self, settings: dict):
+        super().__init__(settings)
+        self.typed = []  # (time.perf_counter(), text)
+
+    def type_text(self, text: str, backlog: int = 0):
+        self.typed.append((time.perf_counter(), text))
+
+OUTPUT_BACKENDS = {
+    "unicode": UnicodeStringBackend,
+    "clipboard": ClipboardPasteBackend,
+    "keys": KeyEventBackend,
+    "stub": StubBackend
+}
+
+def create_output_backend(settings: dict):
+    """Build the output backend named in settings, falling back to unicode injection"""
+    name = settings.get("output_backend", "unicode")
+    return OUTPUT_BACKENDS.get(name, UnicodeStringBackend)(settings)
+
+class OutputWorker(threading.Thread):
+    """Types transcribed text on its own thread so the GUI never waits on key injection"""
+    def __init__(self, status_queue: queue.Queue, settings: dict, backend: Optional[OutputBackend] = None):
+        super().__init__()
+        self.status_queue = status_queue
+        self.settings = settings
+        # An explicitly passed backend (e.g. a stub) is used for every language
+        self.fixed_backend = backend is not None
+        self.backend = backend or create_output_backend(settings)
+        self.language_backends = {}
+        self.queue = queue.Queue()
+        self.daemon = True
+
+    def submit(self, transcript: Transcript):
+        self.queue.put(transcript)
+
+    def backend_for(self, language: Optional[str]):
+        """Backend configured for a language in language_backends, or the default one"""
+        name = self.settings.get("language_backends", {}).get(language)
+        if self.fixed_backend or name not in OUTPUT_BACKENDS or name == self.settings.get("output_backend"):
+            return self.backend
+        if name not in self.language_backends:
+            self.language_backends[name] = OUTPUT_BACKENDS[name](self.settings)
+        return self.language_backends[name]
+
+    def stop(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            transcript = self.queue.get()
+            if transcript is None:
+                break
+            try:
+                with METRICS.span("typing"):
+                    backend = self.backend_for(transcript.language)
+                    backend.type_text(transcript.text + " ", backlog=self.queue.qsize())
+                typed = time.perf_counter()
+                for speech_end in transcript.speech_ends:
+                    METRICS.observe("end_to_end", typed - speech_end)
+            except Exception as e:
+                self.status_queue.put((f"Typing error: {str(e)}", "red"))
+                log.error(f"Typing error: {str(e)}")
+
+class HistoryEntry:
+    """One typed utterance as kept in the session history"""
+    def __init__(self, entry_id: Optional[int], created: float, text: str, language: Optional[str] = None,
+                 confidence: Optional[float] = None, segments=None, session: Optional[str] = None):
+        self.id = entry_id  # Row id, None until the entry is written
+        self.created = created  # time.time() when the text was typed
+        self.text = text
+        self.language = language
+        self.confidence = confidence
+        self.segments = segments or []
+        self.session = session
+
+    def to_dict(self):
+        return {"id": self.id, "created": self.created, "session": self.session, "text": self.text,
+                "language": self.language, "confidence": self.confidence, "segments": self.segments}
+
+HISTORY_COLUMNS = "id, created, text, language, confidence, segments, session"
+
+class TranscriptStore:
+    """Append-only transcript history in SQLite with full-text search.
+
+    add() only queues an entry; a writer thread commits queued entries in
+    batches, compressing their audio when history_audio is on, so typing and
+    decoding never wait on the disk. SQLite assigns the ids, so several
+    instances can share one file. Written entries are cached in an in-memory
+    LRU by id, which serves re-typing; entries not yet written are kept in
+    order until the writer has stored them.
+    """
+    def __init__(self, settings: dict, path: Optional[str] = None):
+        self.settings = settings
+        self.path = path or os.path.join(user_data_dir(), "history.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.session = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.cache = OrderedDict()  # id -> HistoryEntry, least recently used first
+        self.unwritten = deque()  # Entries queued for the writer, oldest first
+        self.cache_size = settings.get("history_memory_entries", 200)
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+
+        # Reads happen on the GUI and hotkey threads; WAL lets them run while the writer commits
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, created REAL, session TEXT, "
+            "text TEXT, language TEXT, confidence REAL, segments TEXT, audio BLOB)")
+        try:
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(text)")
+            self.fts = True
+        except sqlite3.OperationalError:
+            log.warning("SQLite was built without FTS5, history search falls back to substring matching")
+            self.fts = False
+        self.connection.commit()
+
+        self.writer = threading.Thread(target=self.write_loop, daemon=True, name="history-writer")
+        self.writer.start()
+
+    def add(self, transcript: Transcript):
+        """Queue a typed transcript for storage and return its entry"""
+        entry = HistoryEntry(None, time.time(), transcript.text, transcript.language,
+                             transcript.confidence, transcript.segments, self.session)
+        with self.lock:
+            self.unwritten.append(entry)
+        audio = transcript.audio if self.settings.get("history_audio", False) else None
+        self.queue.put((entry, audio))
+        return entry
+
+    def remember(self, entry: HistoryEntry):
+        self.cache[entry.id] = entry
+        self.cache.move_to_end(entry.id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def close(self):
+        """Write everything still queued and stop the writer"""
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.close()
+
+    def write_loop(self):
+        connection = sqlite3.connect(self.path)
+        interval = self.settings.get("history_flush_ms", 500) / 1000
+        done = False
+        while not done:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Collect whatever else arrives within the flush interval and commit it in one transaction
+            deadline = time.monotonic() + interval
+            while len(batch) < 256:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            try:
+                self.write(connection, batch)
+            except sqlite3.Error as e:
+                log.error(f"Could not write transcript history: {str(e)}")
+        connection.close()
+
+    def write(self, connection, batch):
+        started = time.perf_counter()
+        rows = []
+        for entry, audio in batch:
+            blob = None
+            if audio is not None:
+                pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+                blob = zlib.compress(pcm.tobytes(), 1)
+            rows.append((entry.created, entry.session, entry.text, entry.language,
+                         entry.confidence, json.dumps(entry.segments), blob))
+        try:
+            with connection:
+                for (entry, _), row in zip(batch, rows):
+                    # Row by row for lastrowid; another instance may be appending to the same file
+                    cursor = connection.execute(
+                        "INSERT INTO entries (created, session, text, language, confidence, segments, audio) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+                    # Set before commit so readers that see the row can match it to the unwritten entry
+                    entry.id = cursor.lastrowid
+                    if self.fts:
+                        connection.execute("INSERT INTO entries_fts (rowid, text) VALUES (?, ?)",
+                                           (entry.id, entry.text))
+                max_entries = self.settings.get("history_max_entries", 50000)
+                if max_entries:
+                    cutoff = batch[-1][0].id - max_entries
+                    connection.execute("DELETE FROM entries WHERE id <= ?", (cutoff,))
+                    if self.fts:
+                        connection.execute("DELETE FROM entries_fts WHERE rowid <= ?", (cutoff,))
+        except sqlite3.Error:
+            for entry, _ in batch:
+                entry.id = None
+            raise
+        with self.lock:
+            for entry, _ in batch:
+                self.unwritten.remove(entry)
+                self.remember(entry)
+        METRICS.observe("history_write", time.perf_counter() - started)
+
+    @staticmethod
+    def entry_from_row(row):
+        entry_id, created, text, language, confidence, segments, session = row
+        return HistoryEntry(entry_id, created, text, language, confidence, json.loads(segments or "[]"), session)
+
+    def get(self, entry_id: int):
+        with self.lock:
+            entry = self.cache.get(entry_id)
+            if entry is not None:
+                self.cache.move_to_end(entry_id)
+                return entry
+            row = self.connection.execute(
+                f"SELECT {HISTORY_COLUMNS} FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return None
+            entry = self.entry_from_row(row)
+            self.remember(entry)
+            return entry
+
+    def pending(self):
+        """Entries not yet committed, and the ids of those whose rows may already be visible; hold self.lock"""
+        return list(self.unwritten), {entry.id for entry in self.unwritten if entry.id is not None}
 
-class AudioBuffer:
-    def __init__(self, max_size=3):
-        self.buffer = deque(maxlen=max_size)
-        self.silence_threshold = 0.001
-        self.noise_threshold = 0.02
-        self.silence_duration = 1
-        self.last_audio_level = 0
-        self.silence_start = None
-        self.accumulated_chunks = []
-        self.is_recording_speech = False
+    def last(self, count: int):
+        """The newest count entries, oldest first"""
+        if count <= 0:
+            return []
+        with self.lock:
+            unwritten, pending_ids = self.pending()
+            ids = [row[0] for row in self.connection.execute(
+                "SELECT id FROM entries ORDER BY id DESC LIMIT ?", (count + len(pending_ids),))]
+        ids = [entry_id for entry_id in reversed(ids) if entry_id not in pending_ids]
+        entries = (self.get(entry_id) for entry_id in ids)
+        written = [entry for entry in entries if entry is not None]
+        return (written + unwritten)[-count:]
 
-    def add_audio(self, audio_data):
-        self.buffer.append(audio_data)
-        if self.is_recording_speech:
-            self.accumulated_chunks.append(audio_data)
+    def search(self, query: str, limit: int = 20):
+        """Entries matching every word of query, newest first"""
+        terms = query.split()
+        if not terms:
+            return []
+        with self.lock:
+            if self.fts:
+                match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+                rows = self.connection.execute(
+                    f"SELECT {', '.join('e.' + c for c in HISTORY_COLUMNS.split(', '))} FROM entries_fts "
+                    "JOIN entries e ON e.id = entries_fts.rowid WHERE entries_fts MATCH ? "
+                    "ORDER BY e.id DESC LIMIT ?", (match, limit)).fetchall()
+            else:
+                where = " AND ".join("text LIKE ?" for _ in terms)
+                rows = self.connection.execute(
+                    f"SELECT {HISTORY_COLUMNS} FROM entries WHERE {where} ORDER BY id DESC LIMIT ?",
+                    [f"%{term}%" for term in terms] + [limit]).fetchall()
+            # Entries still waiting for the writer are only in memory
+            unwritten, pending_ids = self.pending()
+        lowered = [term.lower() for term in terms]
+        results = [entry for entry in reversed(unwritten) if all(term in entry.text.lower() for term in lowered)]
+        results.extend(self.entry_from_row(row) for row in rows if row[0] not in pending_ids)
+        return results[:limit]
 
-    def get_audio(self):
-        if not self.accumulated_chunks:
+    def audio(self, entry_id: int):
+        """Decompressed 16 kHz audio stored for an entry, or None"""
+        with self.lock:
+            row = self.connection.execute("SELECT audio FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        if row is None or row[0] is None:
             return None
-        return np.concatenate(self.accumulated_chunks)
-
-    def clear(self):
-        self.buffer.clear()
-        self.accumulated_chunks = []
-        self.silence_start = None
-        self.is_recording_speech = False
+        return np.frombuffer(zlib.decompress(row[0]), dtype="<i2").astype(np.float32) / 32767
 
-    def is_silence(self, audio_data):
-        rms = np.sqrt(np.mean(np.square(audio_data)))
-        # Return RMS for GUI updates
-        # The actual processing decision is handled externally
-        is_speech = rms > self.silence_threshold
-        is_noise = self.noise_threshold < rms <= self.silence_threshold
-        is_silent = rms <= self.noise_threshold
+# Every persisted setting with its default; missing keys are filled in on load
+DEFAULT_SETTINGS = {
+    "hotkey": "F9",
+    # A language code, or "auto" to detect it once per language_detect_window_s
+    "language": "en",
+    "language_hotkey": "F8",
+    # Languages the language hotkey cycles through; also the candidates for auto-detection
+    "languages": ["en", "tr"],
+    "language_detect_window_s": 300.0,
+    "language_detect_threshold": 0.5,
+    # Output backend per language; input methods for these scripts tend to swallow injected key events
+    "language_backends": {"ja": "clipboard", "zh": "clipboard", "ko": "clipboard", "yue": "clipboard"},
+    "sensitivity": 0.05,
+    "model_size": "base",
+    "device": "cpu",
+    "compute_type": "int8",
+    # Threads per model worker and model workers; 0 sizes them to the cores left after reserved_cores
+    "cpu_threads": 0,
+    "model_workers": 0,
+    "reserved_cores": 1,
+    "pin_inference": False,  # Keep inference off the reserved cores (Linux)
+    "inference_cores": [],  # Explicit core set for inference, overrides pin_inference
+    "inference_priority": "below_normal",  # "normal", "below_normal" or "idle"; on Windows only threads started by load and warm-up
+    "model_warmup": True,
+    "verify_model_hash": False,
+    "vad_engine": "energy",
+    "vad_flux_threshold": 0.25,
+    "vad_probability_threshold": 0.5,
+    "vad_model_path": None,  # Silero ONNX model to use instead of the one faster-whisper bundles
+    "pre_roll_ms": 300.0,
+    "max_utterance_s": 30.0,
+    # Input device name, or "" for the system default; captured at its native rate and resampled
+    "input_device": "",
+    "capture_block_ms": 64.0,
+    "capture_latency": "low",  # PortAudio latency hint: "low" or "high"
+    # Track the noise floor and derive the speech threshold from it instead of the sensitivity slider
+    "auto_threshold": True,
+    "noise_window_s": 5.0,
+    "noise_snr": 3.0,
+    "noise_min_threshold": 0.002,
+    "noise_floors": {},  # Last measured floor per input device
+    "min_voiced_ms": 150.0,
+    "reject_snr": 2.0,
+    "agc": True,
+    "agc_target_rms": 0.05,
+    "agc_max_gain": 10.0,
+    "streaming": False,
+    "stream_step_ms": 500.0,
+    "stream_window_s": 15.0,
+    "inference_workers": None,  # None sizes the pool to the model's workers and the CPU
+    "max_pending_utterances": 8,
+    "batch_short_s": 3.0,
+    "batch_max_s": 15.0,
+    "decoding_profile": "auto",
+    "beam_size": 5,
+    "latency_target_ms": 1000.0,
+    "long_utterance_s": 10.0,
+    "fallback_logprob": -0.8,
+    "fallback_compression_ratio": 2.4,
+    # Word timings and confidence; runs of words below the probability are re-decoded on their own
+    "word_timestamps": True,
+    "redecode_word_probability": 0.5,
+    "redecode_padding_s": 0.5,
+    "redecode_max_fraction": 0.5,
+    "hotwords": [],
+    "prompt_token_budget": 128,
+    "output_backend": "unicode",
+    # Session history of typed text, searchable and re-typeable with retype_hotkey
+    "history": True,
+    "history_audio": False,  # Also keep the audio, zlib-compressed 16-bit PCM
+    "history_memory_entries": 200,
+    "history_max_entries": 50000,
+    "history_flush_ms": 500.0,
+    "retype_hotkey": "F7",
+    "retype_count": 1,
+    # Decode through a transcription server started with --serve, falling back to a local model
+    "use_server": False,
+    "server_address": "",
+    "server_client_pending": 4,
+    "server_timeout_s": 120.0,
+    "clipboard_restore_delay": 0.2,
+    "typing_budget_s": 1.0,
+    "typing_max_interval": 0.01
+}
 
-        print(f"[DEBUG] RMS: {rms:.6f}, Is Speech: {is_speech}, Is Noise: {is_noise}, Is Silent: {is_silent}")
+def settings_path():
+    return os.path.join(user_config_dir(), "settings.json")
 
-        if is_speech and not self.is_recording_speech:
-            self.is_recording_speech = True
-            self.silence_start = None
-            print("[DEBUG] Speech started")
+def apply_defaults(data: dict):
+    """Merge stored settings over the defaults, replacing values of the wrong type"""
+    # Deep copy so mutating nested lists and dicts never reaches the module defaults
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    for key, value in data.items():
+        default = DEFAULT_SETTINGS.get(key)
+        if default is not None and value is not None:
+            if type(default) is int and isinstance(value, float) and value.is_integer():
+                # Counts and indices stay ints; 2.0 is accepted, 2.5 is not
+                value = int(value)
+            expected = (int, float) if isinstance(default, float) else type(default)
+            if isinstance(value, bool) != isinstance(default, bool) or not isinstance(value, expected):
+                log.warning(f"Ignoring invalid value {value!r} for setting {key}")
+                continue
+        settings[key] = value
+    return settings
 
-        if not is_speech and self.is_recording_speech:
-            if self.silence_start is None:
-                self.silence_start = time.time()
-                print("[DEBUG] Potential silence started")
-        elif is_speech:
-            self.silence_start = None
+def read_settings_file(path):
+    """Load a settings file, or None if it is missing or unreadable"""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
 
-        should_process = False
+def read_settings(path=None):
+    """Saved settings merged over the defaults, without starting a store"""
+    return SettingsStore(path).data
 
-        if self.is_recording_speech and self.silence_start is not None:
-            silence_time = time.time() - self.silence_start
-            if silence_time > self.silence_duration:
-                should_process = True
-                print(f"[DEBUG] Processing after {silence_time:.2f}s of silence")
+class SettingsStore:
+    """In-memory settings persisted atomically to the per-user config file.
 
+    save() only schedules a write; changes made within the debounce window,
+    such as a slider drag, are written once. The file is replaced through a
+    temp file and rename, so a crash can't leave it truncated.
+    """
+    def __init__(self, path=None, debounce=0.5):
+        self.path = path or settings_path()
+        self.debounce = debounce
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.timer = None
+        stored = read_settings_file(self.path)
+        if stored is None and path is None:
+            # Earlier versions kept settings.json in the working directory
+            stored = read_settings_file("settings.json")
+        self.exists = os.path.exists(self.path)
+        self.data = apply_defaults(stored or {})
 
-        if should_process:
-            self.is_recording_speech = False
+    def save(self):
+        """Schedule a write of the current settings"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
 
-        return rms, should_process
+    def flush(self):
+        """Write pending changes now"""
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer.cancel()
+            self.timer = None
+            # Deep, because other threads keep updating nested settings such as noise_floors while this writes
+            snapshot = None
+            for _ in range(3):
+                try:
+                    snapshot = copy.deepcopy(self.data)
+                    break
+                except RuntimeError:
+                    # A nested setting changed size mid-copy; the next attempt sees it settled
+                    continue
+        if snapshot is None:
+            log.error("Could not save settings: they kept changing while being copied")
+            return
+        with self.write_lock:
+            try:
+                atomic_write_json(self.path, snapshot)
+                self.exists = True
+            except OSError as e:
+                log.error(f"Could not save settings: {str(e)}")
 
-class AudioRecorder(threading.Thread):
-    def __init__(self, text_queue: queue.Queue, status_queue: queue.Queue, audio_level_queue: queue.Queue, settings: dict):
+class NotifyingQueue(queue.Queue):
+    """Queue that calls wakeup after every put, so the consumer never has to poll"""
+    def __init__(self, wakeup):
         super().__init__()
-        self.text_queue = text_queue
-        self.status_queue = status_queue
-        self.audio_level_queue = audio_level_queue
-        self.settings = settings
-        self.model = None
-        self.daemon = True
-        self.audio_buffer = AudioBuffer(max_size=3)
-        self.processing = False
-        self.stop_event = threading.Event()
-        self.lock = threading.Lock()
+        self.wakeup = wakeup
 
-    def load_model(self):
-        try:
-            if self.model is None:
-                self.status_queue.put(("Loading Whisper model...", "yellow"))
-                self.model = WhisperModel(
-                    model_size_or_path="base",
-                    device="cpu",
-                    compute_type="int8",
-                    num_workers=4
-                )
-                self.status_queue.put(("Status: Ready", "green"))
-        except Exception as e:
-            self.status_queue.put((f"Error loading model: {str(e)}", "red"))
-            print(f"Model loading error details: {str(e)}")
-            self.stop_event.set()
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self.wakeup()
 
-    def run(self):
-        print("[DEBUG] Starting AudioRecorder thread")
-        self.load_model()
-        if self.model is None:
-            print("[DEBUG] Model failed to load, exiting thread")
-            return
-        
-        sample_rate = 16000
-        block_size = 1024  # Smaller block size for better responsiveness
+class LatestValue:
+    """Single-slot mailbox: put() overwrites, take() returns the newest value once"""
+    def __init__(self):
+        self.value = None
 
-        def callback(indata, frames, time_info, status):
-            if self.stop_event.is_set():
-                raise sd.CallbackStop()
-            audio_data = indata[:, 0].copy()
-            self.audio_buffer.add_audio(audio_data)
-            rms, should_process = self.audio_buffer.is_silence(audio_data)
-            # Send RMS to GUI
-            self.audio_level_queue.put(rms)
-            if should_process and not self.processing:
-                self.processing = True
-                self.status_queue.put(("Processing speech...", "blue"))
-                audio_data_combined = self.audio_buffer.get_audio()
-                if audio_data_combined is not None:
-                    print(f"[DEBUG] Audio data shape: {audio_data_combined.shape}")
-                    print("[DEBUG] Transcribing audio...")
-                    try:
-                        segments, _ = self.model.transcribe(
-                            audio_data_combined,
-                            language=self.settings["language"],
-                            beam_size=5,
-                            vad_filter=True,
-                            vad_parameters=dict(min_silence_duration_ms=500)
-                        )
-                        
-                        text = " ".join([segment.text for segment in segments]).strip()
-                        print(f"[DEBUG] Transcribed text: {text}")
-                        if text:
-                            print("[DEBUG] Sending text to queue")
-                            self.text_queue.put(text)
-                            self.status_queue.put(("Status: Recording", "green"))
-                        else:
-                            print("[DEBUG] No text transcribed")
-                    except Exception as e:
-                        print(f"[DEBUG] Transcription error: {str(e)}")
-                        self.status_queue.put((f"Transcription error: {str(e)}", "red"))
-                else:
-                    print("[DEBUG] No audio data to process")
-                
-                self.audio_buffer.clear()
-                self.processing = False
+    def put(self, value):
+        self.value = value
 
-        try:
-            with sd.InputStream(
-                samplerate=sample_rate,
-                channels=1,
-                dtype='float32',
-                blocksize=block_size,
-                callback=callback
-            ):
-                print("[DEBUG] InputStream started")
-                while not self.stop_event.is_set():
-                    sd.sleep(100)  # Sleep briefly to reduce CPU usage
-        except Exception as e:
-            print(f"[DEBUG] Error in recording stream: {str(e)}")
-            self.status_queue.put((f"Recording error: {str(e)}", "red"))
+    def take(self):
+        value, self.value = self.value, None
+        return value
 
-    def stop(self):
-        """Signal the thread to stop"""
-        self.stop_event.set()
+# Audio level meter refresh interval, roughly the display refresh rate
+LEVEL_REFRESH_MS = 33
 
 class WhisperTyper(ctk.CTk):
     def __init__(self):
         super().__init__()
         
-        self.text_queue = queue.Queue()
-        self.status_queue = queue.Queue()
-        self.audio_level_queue = queue.Queue()
+        # Worker threads wake the Tk loop with one virtual event per batch of updates
+        self.update_pending = threading.Event()
+        self.bind("<<WhisperTyperUpdate>>", self.process_updates)
+        self.text_queue = NotifyingQueue(self.request_update)
+        self.status_queue = NotifyingQueue(self.request_update)
+        self.audio_level_queue = LatestValue()
+        self.input_devices = LatestValue()  # Device names listed once sounddevice is loaded
+        self.level_meter_job = None
         self.keyboard_listener = None
         
         self.title("Whisper Typer")
         self.geometry("400x900")
-        self.resizable(False, False)
+        # Height can change; the controls scroll when they don't fit
+        self.resizable(False, True)
         self.attributes('-topmost', True)
         
         self.recorder: Optional[AudioRecorder] = None
         
         self.load_settings()
-        # Add default language if not present
-        if "language" not in self.settings:
-            self.settings["language"] = "en"
-            self.settings["language_hotkey"] = "F8" 
-            self.save_settings()
+        self.languages = LanguageSelector(self.settings)
+        self.history: Optional[TranscriptStore] = None
+        if self.settings.get("history", True):
+            try:
+                self.history = TranscriptStore(self.settings)
+            except sqlite3.Error as e:
+                log.warning(f"Transcript history disabled: {str(e)}")
+        self.output_worker = OutputWorker(self.status_queue, self.settings)
+        self.output_worker.start()
         self.setup_ui()
+        # Show the window first; imports, hotkeys and the model load in the background
+        self.startup_reported = False
+        self.update_status(("Status: Loading components...", "yellow"))
+        self.after_idle(self.record_window_shown)
+        threading.Thread(target=self.load_components, name="startup", daemon=True).start()
+
+    def record_window_shown(self):
+        elapsed = time.perf_counter() - STARTUP_TIME
+        METRICS.set_gauge("startup_window_seconds", elapsed)
+        log.info(f"Window shown {elapsed:.3f}s after start")
+
+    def load_components(self):
+        """Import heavy modules, register hotkeys and start loading the model"""
+        try:
+            load_heavy_modules()
+        except Exception as e:
+            log.exception(f"Error loading components: {str(e)}")
+            self.status_queue.put((f"Error loading components: {str(e)}", "red"))
+            return
+        for name, done_at, spent in IMPORT_TIMELINE:
+            METRICS.set_gauge(f"import_{name}_seconds", spent)
+        log.info("Import timeline: " + ", ".join(
+            f"{name} {spent:.2f}s (done at {done_at:.2f}s)" for name, done_at, spent in IMPORT_TIMELINE))
+        try:
+            self.input_devices.put(list_input_devices())
+            self.request_update()
+        except Exception as e:
+            log.warning(f"Could not list audio devices: {str(e)}")
         self.setup_hotkey()
         self.setup_language_hotkey()
-        self.check_queues()
+        self.setup_retype_hotkey()
+        log.info(f"Resource plan: {ResourcePlan(self.settings).describe()}")
+        MODEL_REGISTRY.warmup = self.settings.get("model_warmup", True)
+        MODEL_REGISTRY.verify_hash = self.settings.get("verify_model_hash", False)
+        self.preload_model()
 
     def setup_ui(self):
         self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
 
-        container = ctk.CTkFrame(self)
+        # Scrollable, so the settings rows stay reachable on short screens
+        container = ctk.CTkScrollableFrame(self)
         container.grid(row=0, column=0, sticky="nsew", padx=20, pady=20)
         container.grid_columnconfigure(0, weight=1)
         
@@ -276,6 +2559,52 @@ class WhisperTyper(ctk.CTk):
         )
         self.hotkey_combo.grid(row=0, column=1, padx=5, pady=5)
         self.hotkey_combo.set(self.settings["hotkey"])
+
+        model_label = ctk.CTkLabel(hotkey_frame, text="Model:", font=ctk.CTkFont(size=13))
+        model_label.grid(row=1, column=0, padx=(10, 5), pady=5)
+
+        self.model_combo = ctk.CTkOptionMenu(
+            hotkey_frame,
+            values=MODEL_SIZES,
+            command=self.update_model_size,
+            width=120
+        )
+        self.model_combo.grid(row=1, column=1, padx=5, pady=5)
+        self.model_combo.set(self.settings.get("model_size", "base"))
+
+        output_label = ctk.CTkLabel(hotkey_frame, text="Typing:", font=ctk.CTkFont(size=13))
+        output_label.grid(row=2, column=0, padx=(10, 5), pady=5)
+
+        self.output_combo = ctk.CTkOptionMenu(
+            hotkey_frame,
+            values=["unicode", "clipboard", "keys"],
+            command=self.update_output_backend,
+            width=120
+        )
+        self.output_combo.grid(row=2, column=1, padx=5, pady=5)
+        self.output_combo.set(self.settings.get("output_backend", "unicode"))
+
+        decoding_label = ctk.CTkLabel(hotkey_frame, text="Decoding:", font=ctk.CTkFont(size=13))
+        decoding_label.grid(row=3, column=0, padx=(10, 5), pady=5)
+
+        self.decoding_combo = ctk.CTkOptionMenu(
+            hotkey_frame,
+            values=["auto"] + list(DECODING_PROFILES),
+            command=self.update_decoding_profile,
+            width=120
+        )
+        self.decoding_combo.grid(row=3, column=1, padx=5, pady=5)
+        self.decoding_combo.set(self.settings.get("decoding_profile", "auto"))
+
+        self.streaming_switch = ctk.CTkSwitch(
+            hotkey_frame,
+            text="Streaming mode (type while speaking)",
+            command=self.toggle_streaming,
+            font=ctk.CTkFont(size=13)
+        )
+        self.streaming_switch.grid(row=4, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+        if self.settings.get("streaming", False):
+            self.streaming_switch.select()
         
         language_frame = ctk.CTkFrame(container)
         language_frame.grid(row=5, column=0, pady=10, padx=20, sticky="ew")
@@ -283,12 +2612,21 @@ class WhisperTyper(ctk.CTk):
         
         self.language_button = ctk.CTkButton(
             language_frame,
-            text=f"🌐 Current: {'English' if self.settings['language'] == 'en' else 'Turkish'}",
+            text=f"🌐 Current: {language_name(self.settings['language'])}",
             command=self.toggle_language,
             height=35,
             font=ctk.CTkFont(size=13)
         )
         self.language_button.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+
+        self.language_combo = ctk.CTkOptionMenu(
+            language_frame,
+            values=["Auto-detect"] + sorted(LANGUAGES.values()),
+            command=self.select_language,
+            width=140
+        )
+        self.language_combo.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+        self.language_combo.set(language_name(self.settings["language"]))
         
         language_hotkey_label = ctk.CTkLabel(
             language_frame,
@@ -296,6 +2634,17 @@ class WhisperTyper(ctk.CTk):
             font=ctk.CTkFont(size=11)
         )
         language_hotkey_label.grid(row=1, column=0, padx=5, pady=(0,5))
+
+        self.hotwords_entry = ctk.CTkEntry(
+            language_frame,
+            placeholder_text="Vocabulary: names, jargon (comma separated)",
+            height=30
+        )
+        self.hotwords_entry.grid(row=2, column=0, columnspan=2, padx=5, pady=(0,5), sticky="ew")
+        if self.settings.get("hotwords"):
+            self.hotwords_entry.insert(0, ", ".join(self.settings["hotwords"]))
+        self.hotwords_entry.bind("<Return>", lambda _event: self.update_hotwords())
+        self.hotwords_entry.bind("<FocusOut>", lambda _event: self.update_hotwords())
         
         audio_settings_frame = ctk.CTkFrame(container)
         audio_settings_frame.grid(row=6, column=0, pady=10, padx=20, sticky="ew")
@@ -341,6 +2690,49 @@ class WhisperTyper(ctk.CTk):
             font=ctk.CTkFont(size=11)
         )
         self.sensitivity_value_label.grid(row=4, column=0, columnspan=2, pady=(0,5))
+
+        vad_label = ctk.CTkLabel(
+            audio_settings_frame,
+            text="Voice detection:",
+            font=ctk.CTkFont(size=13)
+        )
+        vad_label.grid(row=5, column=0, padx=10, pady=(0,10), sticky="w")
+
+        self.vad_combo = ctk.CTkOptionMenu(
+            audio_settings_frame,
+            values=list(VAD_ENGINES),
+            command=self.update_vad_engine,
+            width=120
+        )
+        self.vad_combo.grid(row=5, column=1, padx=10, pady=(0,10), sticky="e")
+        self.vad_combo.set(self.settings.get("vad_engine", "energy"))
+
+        self.auto_threshold_switch = ctk.CTkSwitch(
+            audio_settings_frame,
+            text="Adapt to background noise",
+            command=self.toggle_auto_threshold
+        )
+        self.auto_threshold_switch.grid(row=6, column=0, columnspan=2, padx=10, pady=(0,10), sticky="w")
+        if self.settings.get("auto_threshold", True):
+            self.auto_threshold_switch.select()
+            self.sensitivity_slider.configure(state="disabled")
+
+        device_label = ctk.CTkLabel(
+            audio_settings_frame,
+            text="Microphone:",
+            font=ctk.CTkFont(size=13)
+        )
+        device_label.grid(row=7, column=0, padx=10, pady=(0,10), sticky="w")
+
+        # Filled in once sounddevice has been imported in the background
+        self.device_combo = ctk.CTkOptionMenu(
+            audio_settings_frame,
+            values=["Default"],
+            command=self.update_input_device,
+            width=160
+        )
+        self.device_combo.grid(row=7, column=1, padx=10, pady=(0,10), sticky="e")
+        self.device_combo.set(self.settings.get("input_device") or "Default")
         
         instructions = """
         📝 Instructions:
@@ -357,7 +2749,7 @@ class WhisperTyper(ctk.CTk):
         """
         
         info_frame = ctk.CTkFrame(container)
-        info_frame.grid(row=7, column=0, pady=20, padx=20, sticky="ew")
+        info_frame.grid(row=8, column=0, pady=(0,20), padx=20, sticky="ew")
         
         info_label = ctk.CTkLabel(
             info_frame,
@@ -368,9 +2760,25 @@ class WhisperTyper(ctk.CTk):
         )
         info_label.pack(padx=15, pady=15)
 
+        history_frame = ctk.CTkFrame(container)
+        # Above the instructions, so search stays in view without scrolling
+        history_frame.grid(row=7, column=0, pady=10, padx=20, sticky="ew")
+        history_frame.grid_columnconfigure(0, weight=1)
+
+        self.history_entry = ctk.CTkEntry(
+            history_frame,
+            placeholder_text=f"Search history (re-type last with {self.settings['retype_hotkey']})",
+            height=30
+        )
+        self.history_entry.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+        self.history_entry.bind("<Return>", lambda _event: self.search_history())
+
+        self.history_box = ctk.CTkTextbox(history_frame, height=90, wrap="word", state="disabled")
+        self.history_box.grid(row=1, column=0, padx=5, pady=(0,5), sticky="ew")
+
     def toggle_recording(self):
         if not self.recorder or not self.recorder.is_alive():
-            print("[DEBUG] Starting recording")
+            log.debug("Starting recording")
             self.initialize_recorder()
             self.recorder.start()
             
@@ -380,29 +2788,40 @@ class WhisperTyper(ctk.CTk):
                 hover_color="#C0392B"
             )
             self.update_status(("Status: Recording", "green"))
-        else:
-            print("[DEBUG] Stopping recording")
+            if self.level_meter_job:
+                self.after_cancel(self.level_meter_job)
+            self.level_meter_job = self.after(LEVEL_REFRESH_MS, self.refresh_audio_level)
+        elif not self.recorder.stop_event.is_set():
+            log.debug("Stopping recording")
             self.recorder.stop()
-            self.recorder.join()
-            self.toggle_button.configure(
-                text=f"🎤 Start Recording (or press {self.settings['hotkey']})",
-                fg_color=["#1E90FF", "#0078D7"],
-                hover_color=["#1871CD", "#005FB3"]
-            )
-            self.update_status(("Status: Ready", "gray"))
-            self.recorder = None
+            self.toggle_button.configure(state="disabled")
+            self.finish_stopping()
+
+    def finish_stopping(self):
+        """Wait for the recorder to flush without blocking the Tk thread, which its status updates need"""
+        if self.recorder and self.recorder.is_alive():
+            self.after(50, self.finish_stopping)
+            return
+        self.toggle_button.configure(
+            text=f"🎤 Start Recording (or press {self.settings['hotkey']})",
+            fg_color=["#1E90FF", "#0078D7"],
+            hover_color=["#1871CD", "#005FB3"],
+            state="normal"
+        )
+        self.update_status(("Status: Ready", "gray"))
+        # The recorder stored this device's noise floor on its way out
+        self.settings_store.save()
+        self.recorder = None
 
     def load_settings(self):
-        try:
-            with open("settings.json", "r") as f:
-                self.settings = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.settings = {"hotkey": "F9", "sensitivity": 0.05}
+        self.settings_store = SettingsStore()
+        self.settings = self.settings_store.data
+        if not self.settings_store.exists:
             self.save_settings()
 
     def save_settings(self):
-        with open("settings.json", "w") as f:
-            json.dump(self.settings, f, indent=4)
+        """Persist settings; rapid successive calls are coalesced into one write"""
+        self.settings_store.save()
 
     def setup_hotkey(self):
         """Setup hotkey using pynput correctly for function keys"""
@@ -418,7 +2837,7 @@ class WhisperTyper(ctk.CTk):
         }
         
         if hotkey not in key_mapping:
-            print(f"[DEBUG] Unsupported hotkey: {hotkey}. Defaulting to F9.")
+            log.warning(f"Unsupported hotkey: {hotkey}. Defaulting to F9.")
             hotkey = "f9"
             self.settings["hotkey"] = "F9"
             self.save_settings()
@@ -435,11 +2854,58 @@ class WhisperTyper(ctk.CTk):
         """Update hotkey with pynput"""
         self.settings["hotkey"] = new_hotkey
         self.save_settings()
-        self.setup_hotkey()
+        # Until pynput has loaded, load_components registers the stored hotkey itself
+        if kb is not None:
+            self.setup_hotkey()
         self.toggle_button.configure(
             text=f"🎤 Start Recording (or press {self.settings['hotkey']})"
         )
 
+    def preload_model(self):
+        """Load the configured model in the background so recording starts instantly"""
+        if self.settings.get("use_server", False):
+            try:
+                connect_server(self.settings)
+                self.status_queue.put(("Status: Ready (server)", "gray"))
+                return
+            except OSError as e:
+                log.warning(f"Transcription server unavailable, falling back to a local model: {str(e)}")
+        key = ModelRegistry.key_from_settings(self.settings)
+        if MODEL_REGISTRY.is_ready(key):
+            return
+        self.status_queue.put((f"Loading Whisper model ({key[0]})...", "yellow"))
+
+        def on_loaded(future):
+            if future.exception() is not None:
+                self.status_queue.put((f"Error loading model: {str(future.exception())}", "red"))
+                return
+            status = "Status: Ready"
+            if not self.startup_reported:
+                self.startup_reported = True
+                elapsed = time.perf_counter() - STARTUP_TIME
+                METRICS.set_gauge("startup_ready_seconds", elapsed)
+                status = f"Status: Ready (started in {elapsed:.1f}s)"
+            if not (self.recorder and self.recorder.is_alive()):
+                self.status_queue.put((status, "gray"))
+
+        MODEL_REGISTRY.preload(key).add_done_callback(on_loaded)
+
+    def update_model_size(self, new_model_size):
+        """Switch the Whisper model; takes effect on the next recording"""
+        self.settings["model_size"] = new_model_size
+        self.save_settings()
+        self.preload_model()
+
+    def update_decoding_profile(self, profile):
+        """Choose between adaptive, always-greedy and always-beam decoding"""
+        self.settings["decoding_profile"] = profile
+        self.save_settings()
+
+    def toggle_streaming(self):
+        """Enable or disable streaming transcription; takes effect on the next recording"""
+        self.settings["streaming"] = bool(self.streaming_switch.get())
+        self.save_settings()
+
     def update_status(self, status_info):
         """Update the status label text and color"""
         if isinstance(status_info, tuple):
@@ -457,75 +2923,109 @@ class WhisperTyper(ctk.CTk):
         else:
             self.progress_label.configure(text="○", text_color="gray")
 
-    def type_text(self, text: str):
-        """Type text using pyautogui with support for Turkish characters"""
-        try:
-            self.after(100)
-            
-            if self.settings["language"] == "tr":
-                kb_controller = kb.Controller()
-                for char in text:
-                    kb_controller.type(char)
-                    time.sleep(0.01)  
-                kb_controller.type(" ")  
-                time.sleep(0.01)
-            else:
-                pyautogui.write(text + " ", interval=0.01)
-                
-        except Exception as e:
-            self.update_status((f"Typing error: {str(e)}", "red"))
-            print(f"[DEBUG] Typing error: {str(e)}")
+    def type_text(self, transcript: Transcript):
+        """Hand text to the output thread, which types it into the focused window"""
+        if self.history:
+            self.history.add(transcript)
+        self.output_worker.submit(transcript)
+
+    def retype_last(self, count: int):
+        """Type the last count history entries again, e.g. after they went to the wrong window"""
+        if not self.history:
+            return
+        for entry in self.history.last(count):
+            self.output_worker.submit(Transcript(entry.text, language=entry.language))
+
+    def search_history(self):
+        """Show history entries matching the search box"""
+        results = self.history.search(self.history_entry.get()) if self.history else []
+        lines = [f"{time.strftime('%m-%d %H:%M', time.localtime(entry.created))}  {entry.text}" for entry in results]
+        self.history_box.configure(state="normal")
+        self.history_box.delete("1.0", "end")
+        self.history_box.insert("1.0", "\n".join(lines) or "No matches")
+        self.history_box.configure(state="disabled")
+
+    def update_output_backend(self, backend_name):
+        """Switch how text is injected into other applications"""
+        self.settings["output_backend"] = backend_name
+        self.save_settings()
+        self.output_worker.backend = create_output_backend(self.settings)
 
     def on_closing(self):
         """Clean up resources before closing"""
-        print("[DEBUG] Closing application...")
+        log.debug("Closing application...")
         if self.recorder and self.recorder.is_alive():
-            print("[DEBUG] Stopping recorder...")
+            log.debug("Stopping recorder...")
             self.recorder.stop()
-            self.recorder.join()
+            # Poll instead of join(): the recorder may need this thread to deliver its last updates
+            self.after(50, self.on_closing)
+            return
         
         if self.keyboard_listener:
-            print("[DEBUG] Stopping keyboard listener...")
+            log.debug("Stopping keyboard listener...")
             self.keyboard_listener.stop()
         
         if hasattr(self, 'language_listener'):
-            print("[DEBUG] Stopping language listener...")
+            log.debug("Stopping language listener...")
             self.language_listener.stop()
+
+        if hasattr(self, 'retype_listener'):
+            self.retype_listener.stop()
+
+        self.output_worker.stop()
+        if self.history:
+            self.history.close()
+        if self.recorder:
+            # Persist the noise floor the recorder measured
+            self.settings_store.save()
+        self.settings_store.flush()
         
         self.destroy() 
 
-    def check_queues(self):
-        """Check text, status, and audio level queues for updates"""
+    def request_update(self):
+        """Ask the Tk loop to drain the text and status queues; safe to call from any thread"""
+        if self.update_pending.is_set():
+            return
+        self.update_pending.set()
         try:
-            while True:
-                try:
-                    text = self.text_queue.get_nowait()
-                    print(f"[DEBUG] Got text from queue: {text}")
-                    self.type_text(text)
-                except queue.Empty:
-                    break
+            self.event_generate("<<WhisperTyperUpdate>>", when="tail")
+        except (RuntimeError, tkinter.TclError):
+            # The window is being destroyed; don't let the flag suppress later wakeups
+            self.update_pending.clear()
 
-            while True:
-                try:
-                    status = self.status_queue.get_nowait()
-                    print(f"[DEBUG] Got status update: {status}")
-                    self.update_status(status)
-                except queue.Empty:
-                    break
+    def process_updates(self, event=None):
+        """Apply queued text and status updates on the Tk thread"""
+        # Clear first so updates queued while draining trigger a new event
+        self.update_pending.clear()
+        devices = self.input_devices.take()
+        if devices is not None:
+            self.device_combo.configure(values=["Default"] + devices)
+        while True:
+            try:
+                self.type_text(self.text_queue.get_nowait())
+            except queue.Empty:
+                break
 
-            while True:
-                try:
-                    rms = self.audio_level_queue.get_nowait()
-                    print(f"[DEBUG] Got audio level: {rms}")
-                    self.update_audio_level(rms)
-                except queue.Empty:
-                    break
+        status = None
+        while True:
+            try:
+                status = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+        # Only the newest status is visible, so intermediate ones are skipped
+        if status is not None:
+            self.update_status(status)
 
-        except Exception as e:
-            print(f"[DEBUG] Queue error: {str(e)}")
-        finally:
-            # Schedule next check
-            self.after(50, self.check_queues)
+    def refresh_audio_level(self):
+        """Show the latest audio level; runs only while recording"""
+        if not (self.recorder and self.recorder.is_alive()):
+            self.level_meter_job = None
+            self.audio_level_frame.set(0)
+            return
+        level = self.audio_level_queue.take()
+        if level is not None:
+            self.update_audio_level(*level)
+        self.level_meter_job = self.after(LEVEL_REFRESH_MS, self.refresh_audio_level)
 
     def initialize_recorder(self):
         """Initialize the recorder instance"""
@@ -534,7 +3034,8 @@ class WhisperTyper(ctk.CTk):
                 self.text_queue, 
                 self.status_queue,
                 self.audio_level_queue,
-                self.settings
+                self.settings,
+                self.languages
             )
 
     def update_sensitivity(self, value):
@@ -542,27 +3043,67 @@ class WhisperTyper(ctk.CTk):
         self.settings["sensitivity"] = float(value)
         self.save_settings()
         self.sensitivity_value_label.configure(text=f"Current: {value:.3f}")
-        # Update threshold indicator position
-        relative_pos = (value - 0.005) / (0.05 - 0.005)  # Adjusted for new range
-        self.threshold_label.grid_configure(padx=(10 + relative_pos * 180, 0))
+        self.move_threshold_marker(value)
         if self.recorder:
             self.recorder.audio_buffer.silence_threshold = value
-            self.recorder.audio_buffer.noise_threshold = value * 0.4
 
-    def update_audio_level(self, rms_value):
-        """Update the audio level indicator"""
+    def move_threshold_marker(self, value):
+        """Place the threshold indicator over the slider scale"""
+        relative_pos = min(1.0, max(0.0, (value - 0.005) / (0.05 - 0.005)))  # Adjusted for new range
+        self.threshold_label.grid_configure(padx=(10 + relative_pos * 180, 0))
+
+    def toggle_auto_threshold(self):
+        """Switch between the tracked noise floor and the manual sensitivity slider"""
+        enabled = bool(self.auto_threshold_switch.get())
+        self.settings["auto_threshold"] = enabled
+        self.save_settings()
+        self.sensitivity_slider.configure(state="disabled" if enabled else "normal")
+        if not enabled:
+            self.update_sensitivity(self.settings["sensitivity"])
+        if self.recorder:
+            self.recorder.audio_buffer.auto_threshold = enabled
+
+    def update_input_device(self, name):
+        """Choose the microphone; takes effect on the next recording"""
+        self.settings["input_device"] = "" if name == "Default" else name
+        self.save_settings()
+
+    def update_vad_engine(self, engine):
+        """Switch the voice activity detector, applying it to a running recorder"""
+        self.settings["vad_engine"] = engine
+        self.save_settings()
+        vad = create_vad(self.settings)
+        if getattr(vad, "fallback_reason", None):
+            self.update_status((vad.fallback_reason, "red"))
+        if self.recorder:
+            self.recorder.audio_buffer.vad = vad
+
+    def update_hotwords(self):
+        """Store the vocabulary used to bias decoding; running decoders pick it up on their next prompt"""
+        hotwords = [word.strip() for word in self.hotwords_entry.get().split(",") if word.strip()]
+        if hotwords == self.settings.get("hotwords", []):
+            return
+        self.settings["hotwords"] = hotwords
+        self.save_settings()
+
+    def update_audio_level(self, rms_value, threshold):
+        """Update the audio level indicator against the threshold the recorder is using"""
         # Normalize RMS value to 0-1 range for progress bar
-        normalized_value = min(1.0, rms_value / self.settings["sensitivity"])
+        normalized_value = min(1.0, rms_value / threshold)
         self.audio_level_frame.set(normalized_value)
         
         # Update color based on threshold
-        if rms_value > self.settings["sensitivity"]:
+        if rms_value > threshold:
             self.audio_level_frame.configure(progress_color="green")
-        elif rms_value > self.settings["sensitivity"] * 0.4:
+        elif rms_value > threshold * 0.4:
             self.audio_level_frame.configure(progress_color="yellow")
         else:
             self.audio_level_frame.configure(progress_color="gray")
 
+        if self.settings.get("auto_threshold", True):
+            self.sensitivity_value_label.configure(text=f"Auto: {threshold:.3f}")
+            self.move_threshold_marker(threshold)
+
     def setup_language_hotkey(self):
         """Setup hotkey for language toggle"""
         def on_language_toggle():
@@ -573,18 +3114,552 @@ class WhisperTyper(ctk.CTk):
         })
         self.language_listener.start()
 
+    def setup_retype_hotkey(self):
+        """Setup hotkey that types the last history entries again"""
+        def on_retype():
+            self.retype_last(self.settings.get("retype_count", 1))
+
+        self.retype_listener = kb.GlobalHotKeys({
+            f'<{self.settings["retype_hotkey"].lower()}>': on_retype
+        })
+        self.retype_listener.start()
+
     def toggle_language(self):
-        """Toggle between English and Turkish"""
-        self.settings["language"] = "tr" if self.settings["language"] == "en" else "en"
+        """Cycle to the next language in the languages setting"""
+        cycle = self.settings.get("languages") or ["en"]
+        current = self.settings["language"]
+        position = cycle.index(current) + 1 if current in cycle else 0
+        self.set_language(cycle[position % len(cycle)])
+
+    def select_language(self, name):
+        """Switch to a language picked from the menu, adding it to the hotkey cycle"""
+        code = "auto" if name == "Auto-detect" else next(code for code, value in LANGUAGES.items() if value == name)
+        if code not in self.settings.setdefault("languages", []):
+            self.settings["languages"].append(code)
+        self.set_language(code)
+
+    def set_language(self, code):
+        self.settings["language"] = code
+        self.languages.reset()
         self.save_settings()
-        self.language_button.configure(
-            text=f"🌐 Current: {'English' if self.settings['language'] == 'en' else 'Turkish'}"
-        )
-        self.update_status(("Language changed to " + 
-                           ("English" if self.settings["language"] == "en" else "Turkish"), 
-                           "blue"))
+        self.language_button.configure(text=f"🌐 Current: {language_name(code)}")
+        self.language_combo.set(language_name(code))
+        self.update_status(("Language changed to " + language_name(code), "blue"))
 
-if __name__ == "__main__":
+AUDIO_EXTENSIONS = (".wav", ".flac")
+# Block size used when replaying files through the segmenter, same as live capture
+FILE_BLOCK_SIZE = 1024
+
+def find_audio_files(paths):
+    """Expand files and directories into a sorted list of WAV/FLAC files"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            files.append(path)
+    return sorted(files)
+
+def read_wav_header(path):
+    """Return (format_tag, channels, sample_rate, bits, data_offset, data_size) of a RIFF/WAVE file"""
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == 0xFFFE and len(body) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE keeps the real format in the sub-format GUID
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path} has no fmt chunk before its data")
+                return fmt + (f.tell(), chunk_size)
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+            if chunk_id == b"fmt " and chunk_size & 1:
+                f.seek(1, os.SEEK_CUR)
+
+WAV_DTYPES = {(1, 16): ("<i2", 32768.0), (1, 32): ("<i4", 2147483648.0), (3, 32): ("<f4", 1.0)}
+
+def iter_audio_blocks(path, block_size=FILE_BLOCK_SIZE):
+    """Yield mono float32 16 kHz blocks of an audio file without loading it all into memory"""
+    if path.lower().endswith(".wav"):
+        format_tag, channels, sample_rate, bits, offset, size = read_wav_header(path)
+        dtype = WAV_DTYPES.get((format_tag, bits))
+        if dtype is not None:
+            sample_dtype, scale = dtype
+            frame_bytes = channels * bits // 8
+            # Recorders that crashed or streamed the file leave a placeholder or overlong data size
+            frames = min(size, os.path.getsize(path) - offset) // frame_bytes
+            if frames <= 0:
+                return
+            data = np.memmap(path, dtype=sample_dtype, mode="r", offset=offset, shape=(frames, channels))
+            # Same streaming resampler as live capture, so other rates never load the whole file
+            resampler = PolyphaseResampler(sample_rate)
+            step = block_size * resampler.down // resampler.up
+            for start in range(0, len(data), step):
+                block = data[start:start + step]
+                mono = (block.mean(axis=1) if channels > 1 else block[:, 0]).astype(np.float32) / scale
+                yield resampler.process(mono)
+            return
+
+    # Other formats go through the decoder bundled with faster-whisper
+    from faster_whisper import decode_audio
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+    for start in range(0, len(audio), block_size):
+        yield audio[start:start + block_size]
+
+def segment_file(path, settings: dict):
+    """Run a file through the live segmenter; yields (start_sample, end_sample, audio) per utterance"""
+    audio_buffer = AudioBuffer(settings)
+    auto_gain = AutoGain(settings) if settings.get("agc", True) else None
+
+    def utterance():
+        audio = audio_buffer.get_audio()
+        if audio is None or audio_buffer.rejection_reason():
+            return None
+        return auto_gain.normalize(audio.copy(), audio_buffer.noise.floor) if auto_gain else audio
+
+    for block in iter_audio_blocks(path):
+        _, should_process = audio_buffer.process(block)
+        if should_process:
+            audio = utterance()
+            if audio is not None:
+                yield audio_buffer.utterance_start, audio_buffer.utterance_end, audio
+            audio_buffer.clear()
+    # Pad with silence so speech running to the end of the file still closes its utterance
+    audio_buffer.process(np.zeros(int(audio_buffer.silence_duration * SAMPLE_RATE) + VAD_FRAME_SIZE, dtype=np.float32))
+    audio = utterance()
+    if audio is not None:
+        yield audio_buffer.utterance_start, audio_buffer.utterance_end or audio_buffer.processed_pos, audio
+
+_file_worker_settings = None
+
+def init_file_worker(settings: dict, log_level: str):
+    """Process pool initializer: each worker loads its own copy of the model"""
+    global _file_worker_settings
+    logging.basicConfig(level=log_level, format="%(asctime)s %(levelname)s [%(processName)s] %(message)s")
+    _file_worker_settings = settings
+    MODEL_REGISTRY.verify_hash = settings.get("verify_model_hash", False)
+    MODEL_REGISTRY.get(ModelRegistry.key_from_settings(settings))
+
+def transcribe_file(path):
+    """Transcribe one file in a pool worker, returning JSON-ready records per utterance"""
+    settings = _file_worker_settings
+    model = MODEL_REGISTRY.get(ModelRegistry.key_from_settings(settings))
+    policy = DecodingPolicy(settings)
+    prompt_context = PromptContext(settings, getattr(model, "hf_tokenizer", None))
+    # With "auto" each file is detected once and its language reused for the rest of it
+    languages = LanguageSelector(dict(settings, language_detect_window_s=float("inf")))
+    records = []
+    for start, end, audio in segment_file(path, settings):
+        language = languages.resolve(model, audio)
+        segments, info = policy.transcribe(model, audio, initial_prompt=prompt_context.build(), language=language)
+        if language is None:
+            languages.observe(info.language, info.language_probability)
+        prompt_context.add(" ".join(segment.text for segment in segments))
+        offset = start / SAMPLE_RATE
+        records.append({
+            "file": path,
+            "start": round(offset, 3),
+            "end": round(end / SAMPLE_RATE, 3),
+            "language": language or info.language,
+            "text": " ".join(segment.text for segment in segments).strip(),
+            "confidence": segment_confidence(segments),
+            "segments": [
+                {"start": start, "end": seg_end, "text": text, "words": words}
+                for start, seg_end, text, words in segment_records(segments, offset)
+            ]
+        })
+    return records
+
+def run_headless(args):
+    """Transcribe files or directories to JSONL without the GUI or an audio device"""
+    settings = read_settings()
+    files = find_audio_files(args.transcribe)
+    if not files:
+        log.error("No WAV or FLAC files found")
+        return 1
+    jobs = max(1, min(args.jobs or max(1, (os.cpu_count() or 1) // 2), len(files)))
+    if not settings.get("cpu_threads"):
+        # Split the cores between workers instead of letting each one claim all of them
+        settings["cpu_threads"] = max(1, len(HOST_CORES) // jobs)
+    # Each process decodes one utterance at a time
+    settings["model_workers"] = 1
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failures = 0
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_file_worker,
+                                 initargs=(settings, args.log_level)) as pool:
+            futures = [(pool.submit(transcribe_file, path), path) for path in files]
+            # Input order rather than completion order, so runs over the same files produce identical output
+            for future, path in futures:
+                try:
+                    records = future.result()
+                except Exception as e:
+                    failures += 1
+                    log.error(f"Failed to transcribe {path}: {str(e)}")
+                    continue
+                for record in records:
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failures else 0
+
+# Local transcription server: one process hosts the model and other instances decode through it
+SERVER_PORT = 47800
+MESSAGE_HEADER = struct.Struct("<II")  # JSON length, PCM length
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+def server_address(settings: dict):
+    """Configured server address, or a per-user Unix socket (localhost TCP on Windows)"""
+    address = settings.get("server_address")
+    if address:
+        return address
+    if sys.platform != "win32" and hasattr(socket, "AF_UNIX"):
+        return os.path.join(user_data_dir(), "server.sock")
+    return f"127.0.0.1:{SERVER_PORT}"
+
+def split_tcp_address(address: str):
+    """(host, port) for a host:port address, or None for a Unix socket path"""
+    host, sep, port = address.rpartition(":")
+    return (host, int(port)) if sep and port.isdigit() else None
+
+def encode_message(payload: dict, audio=None):
+    pcm = b"" if audio is None else np.ascontiguousarray(audio, dtype="<f4").tobytes()
+    body = json.dumps(payload).encode("utf-8")
+    return MESSAGE_HEADER.pack(len(body), len(pcm)) + body + pcm
+
+async def read_message(reader):
+    """Next (payload, audio) from a stream, or None once the peer has closed it"""
+    try:
+        header = await reader.readexactly(MESSAGE_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    json_size, pcm_size = MESSAGE_HEADER.unpack(header)
+    if json_size + pcm_size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {json_size + pcm_size} bytes is too large")
+    payload = json.loads(await reader.readexactly(json_size))
+    audio = np.frombuffer(await reader.readexactly(pcm_size), dtype="<f4") if pcm_size else None
+    return payload, audio
+
+def _recv_exactly(sock, size: int):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Transcription server closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+def serialize_segments(segments, info):
+    return {
+        "segments": [{
+            "start": segment.start,
+            "end": segment.end,
+            "text": segment.text,
+            "avg_logprob": segment.avg_logprob,
+            "compression_ratio": segment.compression_ratio,
+            "no_speech_prob": segment.no_speech_prob,
+            "words": [[word.start, word.end, word.word, word.probability] for word in segment.words or []]
+                     if segment.words is not None else None
+        } for segment in segments],
+        "info": {"language": info.language, "language_probability": info.language_probability,
+                 "duration": info.duration}
+    }
+
+def deserialize_segments(response: dict):
+    segments = []
+    for data in response["segments"]:
+        words = data.pop("words")
+        segment = types.SimpleNamespace(**data)
+        segment.words = None if words is None else [
+            types.SimpleNamespace(start=start, end=end, word=word, probability=probability)
+            for start, end, word, probability in words
+        ]
+        segments.append(segment)
+    return segments, types.SimpleNamespace(**response["info"])
+
+class ServerClient:
+    """One connected client: its queued requests and the slots that bound them"""
+    def __init__(self, writer, max_pending: int):
+        self.writer = writer
+        self.pending = deque()  # (payload, audio) not yet handed to a worker
+        # Reading stops while max_pending requests are unanswered, so the socket pushes back on the client
+        self.slots = asyncio.Semaphore(max_pending)
+        self.send_lock = asyncio.Lock()
+        self.closed = False
+
+    async def send(self, payload: dict):
+        async with self.send_lock:
+            self.writer.write(encode_message(payload))
+            await self.writer.drain()
+
+class TranscriptionServer:
+    """Hosts one model for every local client, taking their requests round-robin.
+
+    Each client keeps one connection open and pipelines requests over it.
+    A client that sends faster than it is served stops being read once
+    server_client_pending requests are queued, and the others keep their
+    turn in the rotation.
+    """
+    def __init__(self, model, settings: dict):
+        self.model = model
+        self.settings = settings
+        self.max_pending = settings.get("server_client_pending", 4)
+        plan = ResourcePlan(settings)
+        self.num_workers = plan.num_workers
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="server-decode",
+                                           initializer=plan.apply)
+        self.ready = deque()  # Clients with queued requests, in turn order
+        self.in_flight = 0
+        self.wakeup = None
+
+    async def serve(self, address: str):
+        self.wakeup = asyncio.Event()
+        tcp = split_tcp_address(address)
+        if tcp:
+            server = await asyncio.start_server(self.handle_client, *tcp)
+        else:
+            if os.path.exists(address):
+                probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    probe.connect(address)
+                except OSError:
+                    # Left behind by a server that did not shut down cleanly
+                    os.unlink(address)
+                else:
+                    raise RuntimeError(f"A transcription server is already listening on {address}")
+                finally:
+                    probe.close()
+            os.makedirs(os.path.dirname(address), exist_ok=True)
+            server = await asyncio.start_unix_server(self.handle_client, path=address)
+            os.chmod(address, 0o600)
+        log.info(f"Transcription server listening on {address}")
+        dispatcher = asyncio.create_task(self.dispatch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self.executor.shutdown(wait=False)
+            if not tcp and os.path.exists(address):
+                os.unlink(address)
+
+    async def handle_client(self, reader, writer):
+        client = ServerClient(writer, self.max_pending)
+        METRICS.increment("server_connections")
+        try:
+            while True:
+                await client.slots.acquire()
+                message = await read_message(reader)
+                if message is None:
+                    break
+                client.pending.append(message)
+                if client not in self.ready:
+                    self.ready.append(client)
+                self.wakeup.set()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            log.warning(f"Dropping transcription client: {str(e)}")
+        finally:
+            client.closed = True
+            client.pending.clear()
+            writer.close()
+
+    async def dispatch(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.ready and self.in_flight < self.num_workers:
+                client = self.ready.popleft()
+                if not client.pending:
+                    continue
+                payload, audio = client.pending.popleft()
+                if client.pending:
+                    self.ready.append(client)
+                self.in_flight += 1
+                asyncio.create_task(self.run_request(client, payload, audio))
+
+    async def run_request(self, client: ServerClient, payload: dict, audio):
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self.executor, self.execute, payload, audio)
+        except Exception as e:
+            log.error(f"Server request failed: {str(e)}")
+            response = {"error": str(e)}
+        response["id"] = payload.get("id")
+        self.in_flight -= 1
+        self.wakeup.set()
+        client.slots.release()
+        if not client.closed:
+            try:
+                await client.send(response)
+            except ConnectionError:
+                pass
+
+    def execute(self, payload: dict, audio):
+        method = payload.get("method")
+        with METRICS.span("server_decode"):
+            if method == "transcribe":
+                segments, info = self.model.transcribe(audio, **payload.get("options", {}))
+                return serialize_segments(list(segments), info)
+            if method == "detect_language":
+                language, probability, all_probabilities = self.model.detect_language(audio)
+                return {"language": language, "probability": probability,
+                        "all_probabilities": [list(item) for item in all_probabilities]}
+        raise ValueError(f"Unknown method {method!r}")
+
+class RemoteModel:
+    """Drop-in for WhisperModel that decodes on a transcription server over one reused connection.
+
+    Requests from several threads are pipelined on the same socket and a
+    reader thread hands each response to the caller waiting for its id.
+    """
+    hf_tokenizer = None  # Prompts are sent as text and tokenized by the server
+
+    def __init__(self, address: str, timeout: float = 120.0):
+        self.address = address
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.next_id = 0
+        self.sock = None
+        self.connect()
+
+    def connect(self):
+        tcp = split_tcp_address(self.address)
+        if tcp:
+            sock = socket.create_connection(tcp, timeout=5)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(5)
+            sock.connect(self.address)
+        sock.settimeout(None)
+        self.sock = sock
+        threading.Thread(target=self.read_loop, args=(sock,), daemon=True, name="server-reader").start()
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def read_loop(self, sock):
+        try:
+            while True:
+                json_size, pcm_size = MESSAGE_HEADER.unpack(_recv_exactly(sock, MESSAGE_HEADER.size))
+                payload = json.loads(_recv_exactly(sock, json_size))
+                _recv_exactly(sock, pcm_size)
+                with self.lock:
+                    future = self.futures.pop(payload.get("id"), None)
+                if future is not None:
+                    future.set_result(payload)
+        except (OSError, ValueError) as e:
+            with self.lock:
+                if self.sock is sock:
+                    self.sock = None
+                futures, self.futures = self.futures, {}
+            for future in futures.values():
+                future.set_exception(ConnectionError(f"Lost transcription server: {str(e)}"))
+
+    def request(self, method: str, audio, **options):
+        future = Future()
+        with self.lock:
+            if self.sock is None:
+                # Reconnect once after the server restarted
+                self.connect()
+            self.next_id += 1
+            request_id = self.next_id
+            self.futures[request_id] = future
+            try:
+                self.sock.sendall(encode_message({"id": request_id, "method": method, "options": options}, audio))
+            except OSError:
+                del self.futures[request_id]
+                raise
+        response = future.result(timeout=self.timeout)
+        if "error" in response:
+            raise RuntimeError(f"Transcription server: {response['error']}")
+        return response
+
+    def transcribe(self, audio, **options):
+        return deserialize_segments(self.request("transcribe", audio, **options))
+
+    def detect_language(self, audio):
+        response = self.request("detect_language", audio)
+        return response["language"], response["probability"], [tuple(item) for item in response["all_probabilities"]]
+
+    def close(self):
+        with self.lock:
+            sock, self.sock = self.sock, None
+        if sock is not None:
+            sock.close()
+
+_remote_model = None
+_remote_lock = threading.Lock()
+
+def connect_server(settings: dict):
+    """Shared connection to the transcription server; raises OSError when none is running"""
+    global _remote_model
+    address = server_address(settings)
+    with _remote_lock:
+        if _remote_model is None or _remote_model.address != address or not _remote_model.connected:
+            if _remote_model is not None:
+                _remote_model.close()
+            _remote_model = RemoteModel(address, settings.get("server_timeout_s", 120.0))
+        return _remote_model
+
+def run_server(args):
+    """Host the configured model for other instances until interrupted"""
+    settings = read_settings()
+    address = server_address(settings)
+    model = MODEL_REGISTRY.get(ModelRegistry.key_from_settings(settings))
+    server = TranscriptionServer(model, settings)
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Speech-to-text that types anywhere on your screen")
+    parser.add_argument("--log-level", default="WARNING",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Logging verbosity (default: WARNING, which keeps the audio path quiet)")
+    parser.add_argument("--metrics-out", help="Write a JSON metrics snapshot to this file on exit")
+    parser.add_argument("--transcribe", nargs="+", metavar="PATH",
+                        help="Transcribe WAV/FLAC files or directories to JSONL instead of opening the window")
+    parser.add_argument("--output", help="JSONL file for --transcribe results (default: stdout)")
+    parser.add_argument("--jobs", type=int, help="Worker processes for --transcribe, each with its own model")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="Print transcript history entries matching QUERY as JSONL and exit")
+    parser.add_argument("--serve", action="store_true",
+                        help="Host the model for other instances on this machine instead of opening the window")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s [%(threadName)s] %(message)s")
+    if args.transcribe:
+        return run_headless(args)
+    if args.serve:
+        return run_server(args)
+    if args.search:
+        store = TranscriptStore(read_settings())
+        for entry in store.search(args.search, limit=100):
+            print(json.dumps(entry.to_dict(), ensure_ascii=False))
+        store.close()
+        return 0
     try:
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
@@ -592,5 +3667,10 @@ if __name__ == "__main__":
         app.protocol("WM_DELETE_WINDOW", app.on_closing)
         app.mainloop()
     except Exception as e:
-        print(f"Application error: {str(e)}")
+        log.exception(f"Application error: {str(e)}")
+    finally:
+        if args.metrics_out:
+            METRICS.export(args.metrics_out)
 
+if __name__ == "__main__":
+    sys.exit(main())